@@ -0,0 +1,80 @@
+"""
+Measures write-to-notification round trip of BleakDriver against a fake bleak client that echoes every write.
+Compares current event-driven driver with the previous implementation that polled its queues.
+Requires `bleak` to be installed. Run from repository root with: python -m benchmarks.bleak_latency
+"""
+import asyncio
+import logging
+import statistics
+import threading
+import time
+
+import pylgbst.comms.cbleak as cbleak
+from pylgbst.comms.fakebleak import fake_bleak_connection
+
+log = logging.getLogger("benchmark")
+
+ROUNDS = 50
+
+
+class PollingBleakDriver(cbleak.BleakDriver):
+    """Previous implementation, with sleep-based polling of both queues"""
+
+    def __init__(self, hub_mac=None, hub_name=None):
+        super().__init__(hub_mac, hub_name)
+        self._abort = False
+        self.polled_requests = cbleak.queue.Queue()
+
+    async def _bleak_thread(self):
+        bleak = cbleak.BleakConnection()
+        await bleak.connect(self.hub_mac, self.hub_name)
+        await bleak.set_notify_handler((self._safe_handler, self.resp_queue))
+        while not self._abort:
+            await asyncio.sleep(0.1)
+            if self.polled_requests.qsize() != 0:
+                data = self.polled_requests.get()
+                await bleak.write(data[0], data[1])
+
+    def _processing(self):
+        while not self._abort:
+            if self.resp_queue.qsize() != 0:
+                msg = self.resp_queue.get()
+                self._handler(msg[0], bytes(msg[1]))
+
+            time.sleep(0.01)
+
+    def write(self, handle, data):
+        self.polled_requests.put((handle, data))
+
+    def disconnect(self):
+        self._abort = True
+
+
+def measure(driver_class):
+    received = threading.Event()
+    driver = driver_class()
+    driver.set_notify_handler(lambda *args: received.set())
+    driver.enable_notifications()
+    time.sleep(0.2)
+
+    samples = []
+    for _ in range(ROUNDS):
+        received.clear()
+        start = time.perf_counter()
+        driver.write(0x0E, b"\x05\x00\x01\x06\x05")
+        received.wait()
+        samples.append(time.perf_counter() - start)
+
+    driver.disconnect()
+    return samples
+
+
+def report(name, samples):
+    log.info("%-20s median %8.3f ms, max %8.3f ms", name, 1000 * statistics.median(samples), 1000 * max(samples))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    with fake_bleak_connection():
+        report("polling driver", measure(PollingBleakDriver))
+        report("event driver", measure(cbleak.BleakDriver))
@@ -0,0 +1,43 @@
+"""
+Measures decoding speed for every message kind in UPSTREAM_MSGS.
+Run with: python -m benchmarks.decode
+"""
+import logging
+import timeit
+from binascii import unhexlify
+
+from pylgbst.messages import UPSTREAM_MSGS
+
+log = logging.getLogger("benchmark")
+
+SAMPLES = {
+    0x01: '1200 01 01 06 4c45474f204d6f766520487562',  # MsgHubProperties
+    0x02: '0400 02 30',  # MsgHubAction
+    0x03: '0600 03 01 04 ff',  # MsgHubAlert
+    0x04: '0f00 04 01 01 26000000001000000010',  # MsgHubAttachedIO
+    0x05: '0500 05 61 05',  # MsgGenericError
+    0x43: '1500 43 02 02 4f00 0300 0500 0900 1100 2100 4100 8100 0000',  # MsgPortInfo, mode combinations
+    0x44: '1100 44 02 00 00 434f4c4f5200000000000000',  # MsgPortModeInfo
+    0x45: '0800 45 02 ff0aff00',  # MsgPortValueSingle
+    0x46: '0a00 46 02 0300 ff0a 0000',  # MsgPortValueCombined
+    0x47: '0a00 47 02 08 01000000 01',  # MsgPortInputFmtSingle
+    0x48: '0700 48 02 81 0300',  # MsgPortInputFmtCombined
+    0x82: '0500 82 03 0a',  # MsgPortOutputFeedback
+}
+
+NUMBER = 20000
+
+
+def run():
+    total = 0.0
+    for msg_kind in UPSTREAM_MSGS:
+        data = unhexlify(SAMPLES[msg_kind.TYPE].replace(' ', ''))
+        spent = min(timeit.repeat(lambda: msg_kind.decode(data), number=NUMBER, repeat=3))
+        total += spent
+        log.info("%-25s %6.2f us/msg", msg_kind.__name__, 1000000 * spent / NUMBER)
+    log.info("%-25s %6.2f us/msg", "average", 1000000 * total / NUMBER / len(UPSTREAM_MSGS))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run()
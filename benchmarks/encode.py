@@ -0,0 +1,60 @@
+"""
+Measures encoding speed of motor commands, comparing precompiled struct layouts
+with the previous field-by-field concatenation of `pack` results.
+Run with: python -m benchmarks.encode
+"""
+import logging
+import timeit
+from struct import pack
+
+from pylgbst.comms import Connection
+from pylgbst.hub import Hub
+from pylgbst.messages import MsgPortOutput
+from pylgbst.peripherals import EncodedMotor
+
+log = logging.getLogger("benchmark")
+
+NUMBER = 50000
+
+
+class NullConnection(Connection):
+    def is_alive(self):
+        return True
+
+    def write(self, handle, data):
+        pass
+
+    def set_notify_handler(self, handler):
+        pass
+
+
+def legacy_angled_bytes(motor, degrees, speed, max_power=1.0, end_state=EncodedMotor.END_STATE_BRAKE):
+    params = b""
+    params += pack("<I", degrees)
+    params += pack("<b", motor._speed_abs(speed))
+    params += pack("<B", int(100 * max_power))
+    params += pack("<B", end_state)
+    params += pack("<B", 0b11)
+
+    msg = MsgPortOutput(motor.port, EncodedMotor.SUBCMD_START_SPEED_FOR_DEGREES, params)
+    flags = MsgPortOutput.SC_NO_BUFFER | MsgPortOutput.SC_FEEDBACK
+    payload = pack("<B", msg.port) + pack("<B", flags) + pack("<B", msg.subcommand) + params
+    return pack("<B", len(payload) + 3) + pack("<B", msg.hub_id) + pack("<B", msg.TYPE) + payload
+
+
+def run():
+    motor = EncodedMotor(Hub(NullConnection()), 0x00)
+    assert legacy_angled_bytes(motor, 180, 0.5) == motor._angled_msg(180, 0.5).bytes()
+
+    legacy = min(timeit.repeat(lambda: legacy_angled_bytes(motor, 180, 0.5), number=NUMBER, repeat=7))
+    current = min(timeit.repeat(lambda: motor._angled_msg(180, 0.5).bytes(), number=NUMBER, repeat=7))
+    msg = motor._angled_msg(180, 0.5)
+    encoding = min(timeit.repeat(msg.bytes, number=NUMBER, repeat=7))
+    log.info("%-15s %6.2f us/msg", "concatenation", 1000000 * legacy / NUMBER)
+    log.info("%-15s %6.2f us/msg", "precompiled", 1000000 * current / NUMBER)
+    log.info("%-15s %6.2f us/msg", "bytes() only", 1000000 * encoding / NUMBER)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run()
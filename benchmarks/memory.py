@@ -0,0 +1,60 @@
+"""
+Measures memory held by decoded notifications, comparing slotted message classes
+with plain objects that keep the same fields in instance `__dict__`, as messages did before.
+Run with: python -m benchmarks.memory
+"""
+import logging
+import tracemalloc
+from binascii import unhexlify
+
+from pylgbst.messages import MsgPortValueSingle, MsgPortOutputFeedback, MsgPortInputFmtSingle
+
+log = logging.getLogger("benchmark")
+
+SAMPLES = {
+    MsgPortValueSingle: '0800 45 02 ff0aff00',
+    MsgPortOutputFeedback: '0500 82 03 0a',
+    MsgPortInputFmtSingle: '0a00 47 02 08 01000000 01',
+}
+
+COUNT = 100000
+
+
+class DictMsg:
+    """Stand-in for a message without slots"""
+
+    def __init__(self, msg):
+        self.hub_id = msg.hub_id
+        self.payload = msg._data  # same data reference, to count only instance overhead
+        for name, value in msg._fields():
+            setattr(self, name, value)
+
+
+def measure(factory):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        kept = [factory() for _ in range(COUNT)]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    count = sum(stat.count_diff for stat in stats)
+    del kept
+    return size / COUNT, count / COUNT
+
+
+def run():
+    for msg_kind, sample in SAMPLES.items():
+        data = unhexlify(sample.replace(' ', ''))
+        slotted = measure(lambda: msg_kind.decode(data))
+        legacy = measure(lambda: DictMsg(msg_kind.decode(data)))
+        log.info("%-25s slots: %6.1f bytes, %4.1f blocks; dict: %6.1f bytes, %4.1f blocks",
+                 msg_kind.__name__, slotted[0], slotted[1], legacy[0], legacy[1])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run()
@@ -0,0 +1,236 @@
+"""
+Discovery of port capabilities, and their persistent cache, as they take many requests to collect from hub
+"""
+import collections
+import json
+import logging
+import os
+import tempfile
+from concurrent import futures
+
+from pylgbst.messages import MsgPortInfo, MsgPortInfoRequest, MsgPortModeInfo, MsgPortModeInfoRequest
+
+log = logging.getLogger("capabilities")
+
+
+class ModeCapabilities:
+    """
+    Description of single port mode, fields stay None for info that hub did not provide
+    """
+
+    # mode info type => field name
+    FIELDS = {
+        MsgPortModeInfoRequest.INFO_NAME: "name",
+        MsgPortModeInfoRequest.INFO_RAW_RANGE: "raw_range",
+        MsgPortModeInfoRequest.INFO_PCT_RANGE: "pct_range",
+        MsgPortModeInfoRequest.INFO_SI_RANGE: "si_range",
+        MsgPortModeInfoRequest.INFO_UNITS: "units",
+        MsgPortModeInfoRequest.INFO_MAPPING: "mapping",
+        MsgPortModeInfoRequest.INFO_MOTOR_BIAS: "motor_bias",
+        MsgPortModeInfoRequest.INFO_CAPABILITY_BITS: "capability_bits",
+        MsgPortModeInfoRequest.INFO_VALUE_FORMAT: "value_format",
+    }
+
+    def __init__(self, mode, is_input=False, is_output=False):
+        self.mode = mode
+        self.is_input = is_input
+        self.is_output = is_output
+        for field in self.FIELDS.values():
+            setattr(self, field, None)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.to_dict())
+
+    def to_dict(self):
+        data = {"mode": self.mode, "is_input": self.is_input, "is_output": self.is_output}
+        for field in self.FIELDS.values():
+            value = getattr(self, field)
+            data[field] = value.hex() if isinstance(value, (bytes, bytearray)) else value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        caps = cls(data["mode"], data["is_input"], data["is_output"])
+        for field in cls.FIELDS.values():
+            setattr(caps, field, data[field])
+        if caps.capability_bits is not None:
+            caps.capability_bits = bytes.fromhex(caps.capability_bits)
+        return caps
+
+
+class PortCapabilities:
+    """
+    Description of port and all of its modes
+    :type modes: dict[int,ModeCapabilities]
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.total_modes = 0
+        self.can_input = False
+        self.can_output = False
+        self.combinable = False
+        self.synchronizable = False
+        self.mode_combinations = []  # lists of modes that can be combined
+        self.modes = {}  # mode number => ModeCapabilities
+
+    def __repr__(self):
+        return "%s(port=0x%x, modes=%s)" % (self.__class__.__name__, self.port, list(self.modes.values()))
+
+    @property
+    def input_modes(self):
+        """
+        :rtype: list[ModeCapabilities]
+        """
+        return [x for x in self.modes.values() if x.is_input]
+
+    @property
+    def output_modes(self):
+        """
+        :rtype: list[ModeCapabilities]
+        """
+        return [x for x in self.modes.values() if x.is_output]
+
+    def to_dict(self):
+        return {
+            "port": self.port,
+            "total_modes": self.total_modes,
+            "can_input": self.can_input,
+            "can_output": self.can_output,
+            "combinable": self.combinable,
+            "synchronizable": self.synchronizable,
+            "mode_combinations": self.mode_combinations,
+            "modes": [x.to_dict() for x in self.modes.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        caps = cls(data["port"])
+        for field in ("total_modes", "can_input", "can_output", "combinable", "synchronizable", "mode_combinations"):
+            setattr(caps, field, data[field])
+        for mode_data in data["modes"]:
+            mode = ModeCapabilities.from_dict(mode_data)
+            caps.modes[mode.mode] = mode
+        return caps
+
+
+def discover_port(hub, port, window=8, timeout=None):
+    """
+    Queries port info and every info type of each existing mode exactly once.
+    Up to `window` requests are kept in flight at a time, instead of waiting for each reply in turn.
+
+    :type hub: pylgbst.hub.Hub
+    :param timeout: seconds to wait for each reply, hub's default timeout is used if None
+    :rtype: PortCapabilities
+    """
+    assert window > 0
+    if timeout is None:
+        timeout = hub.timeout
+
+    mode_info = hub.send(MsgPortInfoRequest(port, MsgPortInfoRequest.INFO_MODE_INFO), timeout)
+    assert isinstance(mode_info, MsgPortInfo)
+    caps = PortCapabilities(port)
+    caps.total_modes = mode_info.total_modes
+    caps.can_input = mode_info.is_input()
+    caps.can_output = mode_info.is_output()
+    caps.combinable = mode_info.is_combinable()
+    caps.synchronizable = mode_info.is_synchronizable()
+
+    requests = []
+    if caps.combinable:
+        requests.append(MsgPortInfoRequest(port, MsgPortInfoRequest.INFO_MODE_COMBINATIONS))
+
+    for mode in range(caps.total_modes):
+        caps.modes[mode] = ModeCapabilities(mode, mode in mode_info.input_modes, mode in mode_info.output_modes)
+        requests.extend(MsgPortModeInfoRequest(port, mode, info_type) for info_type in ModeCapabilities.FIELDS)
+
+    in_flight = collections.deque()
+    try:
+        for request in requests:
+            if len(in_flight) >= window:
+                _apply_reply(caps, *in_flight.popleft(), timeout)
+            in_flight.append((request, hub.send_request(request)))
+
+        while in_flight:
+            _apply_reply(caps, *in_flight.popleft(), timeout)
+    finally:
+        for _, reply in in_flight:
+            reply.cancel()
+
+    log.debug("Capabilities of port 0x%x: %s", port, caps)
+    return caps
+
+
+def _apply_reply(caps, request, reply, timeout):
+    try:
+        resp = reply.result(timeout)
+    except futures.TimeoutError:
+        reply.cancel()
+        raise TimeoutError("No reply to %r within %ss" % (request, timeout))
+    except RuntimeError as exc:
+        log.debug("Port 0x%x has no info for %r: %s", caps.port, request, exc)
+        return
+
+    if isinstance(request, MsgPortInfoRequest):
+        assert isinstance(resp, MsgPortInfo)
+        caps.mode_combinations = [x for x in resp.possible_mode_combinations if x]
+    else:
+        assert isinstance(resp, MsgPortModeInfo)
+        setattr(caps.modes[request.mode], ModeCapabilities.FIELDS[request.info_type], resp.value)
+
+
+class CapabilityCache:
+    """
+    Keeps port mode descriptions in JSON files, one per device type and its hardware and firmware revisions.
+    Same device with same firmware has the same modes, so description collected once can be reused by later sessions.
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: where to keep description files, `~/.cache/pylgbst` by default
+        """
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".cache", "pylgbst")
+        self.directory = directory
+
+    def _path(self, dev_type, hw_revision, sw_revision):
+        return os.path.join(self.directory, "port_%04x_hw%s_sw%s.json" % (dev_type, hw_revision, sw_revision))
+
+    def load(self, dev_type, hw_revision, sw_revision):
+        """
+        :return: cached description, None if there is none
+        :rtype: dict
+        """
+        path = self._path(dev_type, hw_revision, sw_revision)
+        try:
+            with open(path) as fhd:
+                return json.load(fhd)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            log.warning("Failed to read cached description %s: %s", path, exc)
+            return None
+
+    def save(self, dev_type, hw_revision, sw_revision, description):
+        """
+        Writes description atomically, so concurrent sessions never read partially written file
+        :type description: dict
+        """
+        path = self._path(dev_type, hw_revision, sw_revision)
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as fhd:
+                json.dump(description, fhd, default=self._json_default)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as exc:
+            log.warning("Failed to cache description in %s: %s", path, exc)
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _json_default(obj):
+        if isinstance(obj, (bytes, bytearray)):
+            return obj.hex()  # raw values of unknown mode info types
+        raise TypeError("Can't serialize %r" % obj)
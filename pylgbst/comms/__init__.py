@@ -40,6 +40,10 @@ class Connection:
 
     @abstractmethod
     def set_notify_handler(self, handler):
+        """
+        :param handler: callable(handle, data, timestamp=None), timestamp is `time.monotonic_ns()` of data receipt,
+            drivers that buffer notifications have to provide it
+        """
         pass
 
     def enable_notifications(self):
@@ -87,7 +91,7 @@ class DebugServer:
             conn, addr = self.sock.accept()
             if not self._running:
                 raise KeyboardInterrupt("Shutdown")
-            self.connection.set_notify_handler(lambda x, y: self._notify(conn, x, y))
+            self.connection.set_notify_handler(lambda *args: self._notify(conn, *args))
             try:
                 self._handle_conn(conn)
             except KeyboardInterrupt:
@@ -101,11 +105,11 @@ class DebugServer:
     def __del__(self):
         self.sock.close()
 
-    def _notify_dummy(self, handle, data):
+    def _notify_dummy(self, handle, data, timestamp=None):
         log.debug("Dropped notification from handle %s: %s", handle, binascii.hexlify(data))
         self._check_shutdown(data)
 
-    def _notify(self, conn, handle, data):
+    def _notify(self, conn, handle, data, timestamp=None):
         payload = {"type": "notification", "handle": handle, "data": str2hex(data)}
         log.debug("Send notification: %s", payload)
         try:
@@ -8,6 +8,7 @@ import time
 import bleak
 
 from pylgbst.comms import Connection, MOVE_HUB_HW_UUID_CHAR, MOVE_HUB_HW_UUID_SERV
+from pylgbst.utilities import LazyHex
 
 log = logging.getLogger('comms-bleak')
 
@@ -24,13 +25,15 @@ class BleakDriver(Connection):
         self.hub_mac = hub_mac
         self.hub_name = hub_name
         self._handler = None
-        self._abort = False
         self._connection_thread = None
         self._processing_thread = None
+        self._loop = None
+        self._loop_ready = threading.Event()
 
-        # Queues to handle request / responses. Acts as a buffer between API and async BLE driver
+        # Queues to handle request / responses. Acts as a buffer between API and async BLE driver.
+        # Request queue is created inside the communication thread, since it belongs to its event loop
         self.resp_queue = queue.Queue()
-        self.req_queue = queue.Queue()
+        self.req_queue = None
 
     def set_notify_handler(self, handler):
         """
@@ -57,6 +60,10 @@ class BleakDriver(Connection):
         self._processing_thread.start()
 
     async def _bleak_thread(self):
+        self._loop = asyncio.get_running_loop()
+        self.req_queue = asyncio.Queue()
+        self._loop_ready.set()
+
         bleak = BleakConnection()
         # For MacOS 12+ the service_uuids kwarg is required for scanning
         kwargs = {}
@@ -67,25 +74,25 @@ class BleakDriver(Connection):
         # After connecting, need to send any data or hub will drop the connection,
         # below command is Advertising name request update
         await bleak.write_char(MOVE_HUB_HW_UUID_CHAR, bytearray([0x05, 0x00, 0x01, 0x01, 0x05]))
-        while not self._abort:
-            await asyncio.sleep(0.1)
-            if self.req_queue.qsize() != 0:
-                data = self.req_queue.get()
-                await bleak.write(data[0], data[1])
+        while True:
+            data = await self.req_queue.get()
+            if data is None:  # put by disconnect()
+                break
+            await bleak.write(data[0], data[1])
 
         logging.info("Communications thread has exited")
 
     @staticmethod
     def _safe_handler(handler, data, resp_queue):
-        resp_queue.put((handler, data))
+        resp_queue.put((handler, data, time.monotonic_ns()))  # stamped before any queueing delay
 
     def _processing(self):
-        while not self._abort:
-            if self.resp_queue.qsize() != 0:
-                msg = self.resp_queue.get()
-                self._handler(msg[0], bytes(msg[1]))
+        while True:
+            msg = self.resp_queue.get()
+            if msg is None:  # put by disconnect()
+                break
+            self._handler(msg[0], bytes(msg[1]), msg[2])
 
-            time.sleep(0.01)
         logging.info("Processing thread has exited")
 
     def write(self, handle, data):
@@ -100,7 +107,8 @@ class BleakDriver(Connection):
         if not self._connection_thread.is_alive() or not self._processing_thread.is_alive():
             raise ConnectionError('Something went wrong, communication threads not functioning.')
 
-        self.req_queue.put((handle, data))
+        self._loop_ready.wait()
+        self._loop.call_soon_threadsafe(self.req_queue.put_nowait, (handle, data))
 
     def disconnect(self):
         """
@@ -108,7 +116,10 @@ class BleakDriver(Connection):
 
         :return: None
         """
-        self._abort = True
+        self.resp_queue.put(None)
+        if self._connection_thread is not None and self._connection_thread.is_alive():
+            self._loop_ready.wait()
+            self._loop.call_soon_threadsafe(self.req_queue.put_nowait, None)
 
     def is_alive(self):
         """
@@ -172,7 +183,7 @@ class BleakConnection(Connection):
 
         self._client = bleak.BleakClient(self._device)
         status = await self._client.connect()
-        log.debug('Connection status: {status}'.format(status=status))
+        log.debug('Connection status: %s', status)
 
     async def write(self, handle, data):
         """
@@ -183,7 +194,8 @@ class BleakConnection(Connection):
         :param data: data to send
         :return: None
         """
-        log.debug('Request: {handle} {payload}'.format(handle=handle, payload=[hex(x) for x in data]))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Request: %s %s', handle, LazyHex(data))
         desc = self._client.services.get_descriptor(handle)
 
         if not isinstance(data, bytearray):
@@ -215,7 +227,8 @@ class BleakConnection(Connection):
         handler, resp_queue = inputs
 
         def c(handle, data):
-            log.debug('Response: {handle} {payload}'.format(handle=handle, payload=[hex(x) for x in data]))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('Response: %s %s', handle, LazyHex(data))
             handler(handle, data, resp_queue)
 
         await self._client.start_notify(MOVE_HUB_HW_UUID_CHAR, c)
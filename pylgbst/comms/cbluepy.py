@@ -5,7 +5,7 @@ from threading import Thread, Event
 from bluepy import btle
 
 from pylgbst.comms import Connection
-from pylgbst.utilities import str2hex, queue
+from pylgbst.utilities import LazyHex, queue
 
 log = logging.getLogger('comms-bluepy')
 
@@ -111,7 +111,7 @@ class BluepyConnection(Connection):
         self._peripheral.disconnect()
 
     def write(self, handle, data):
-        log.debug("Writing to handle %s: %s", handle, str2hex(data))
+        log.debug("Writing to handle %s: %s", handle, LazyHex(data))
         self._peripheral.write(handle, data)
 
     def set_notify_handler(self, handler):
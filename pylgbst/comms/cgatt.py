@@ -7,7 +7,7 @@ import gatt
 
 from pylgbst.comms import Connection, MOVE_HUB_HW_UUID_SERV, MOVE_HUB_HW_UUID_CHAR, \
     MOVE_HUB_HARDWARE_HANDLE
-from pylgbst.utilities import str2hex
+from pylgbst.utilities import LazyHex
 
 log = logging.getLogger('comms-gatt')
 
@@ -31,7 +31,7 @@ class CustomDevice(gatt.Device):
             raise exc
 
     def write(self, data):
-        log.debug("Writing to handle: %s", str2hex(data))
+        log.debug("Writing to handle: %s", LazyHex(data))
         return self._handle.write_value(data)
 
     def enable_notifications(self):
@@ -59,7 +59,7 @@ class CustomDevice(gatt.Device):
 
     def characteristic_value_updated(self, characteristic, value):
         value = self._fix_weird_bug(value)
-        log.debug('Notification in GattDevice: %s', str2hex(value))
+        log.debug('Notification in GattDevice: %s', LazyHex(value))
         self._notify_callback(MOVE_HUB_HARDWARE_HANDLE, value)
 
     def _fix_weird_bug(self, value):
@@ -1,12 +1,13 @@
 # noinspection PyMethodOverriding
 import logging
+import time
 import traceback
 from threading import Thread
 
 from gattlib import DiscoveryService, GATTRequester
 
 from pylgbst.comms import Connection
-from pylgbst.utilities import queue, str2hex
+from pylgbst.utilities import LazyHex, queue, str2hex
 
 log = logging.getLogger('comms-gattlib')
 
@@ -29,18 +30,18 @@ class Requester(GATTRequester):
 
     def on_notification(self, handle, data):
         # log.debug("requester notified, sink: %s", self.notification_sink)
-        self._notify_queue.put((handle, data))
+        self._notify_queue.put((handle, data, time.monotonic_ns()))
 
     def on_indication(self, handle, data):
-        log.debug("Indication on handle %s: %s", handle, str2hex(data))
+        log.debug("Indication on handle %s: %s", handle, LazyHex(data))
 
     def _dispatch_notifications(self):
         while True:
-            handle, data = self._notify_queue.get()
+            handle, data, timestamp = self._notify_queue.get()
             data = data[3:]  # for some reason, there are extra bytes
             if self.notification_sink:
                 try:
-                    self.notification_sink(handle, data)
+                    self.notification_sink(handle, data, timestamp)
                 except BaseException:
                     log.warning("Data was: %s", str2hex(data))
                     log.warning("Failed to dispatch notification: %s", traceback.format_exc())
@@ -87,7 +88,7 @@ class GattLibConnection(Connection):
             raise RuntimeError("No requester available")
 
     def write(self, handle, data):
-        log.debug("Writing to %s: %s", handle, str2hex(data))
+        log.debug("Writing to %s: %s", handle, LazyHex(data))
         return self.requester.write_by_handle(handle, data)
 
     def is_alive(self):
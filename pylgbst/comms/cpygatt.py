@@ -3,7 +3,7 @@ import logging
 import pygatt
 
 from pylgbst.comms import Connection, MOVE_HUB_HW_UUID_CHAR
-from pylgbst.utilities import str2hex
+from pylgbst.utilities import LazyHex
 
 log = logging.getLogger('comms-pygatt')
 
@@ -47,7 +47,7 @@ class GattoolConnection(Connection):
         self._conn_hnd.disconnect()
 
     def write(self, handle, data):
-        log.debug("Writing to handle %s: %s", handle, str2hex(data))
+        log.debug("Writing to handle %s: %s", handle, LazyHex(data))
         return self._conn_hnd.char_write_handle(handle, bytearray(data))
 
     def set_notify_handler(self, handler):
@@ -0,0 +1,42 @@
+"""
+Stand-in for BLE client of `BleakDriver`, lets tests and benchmarks run the driver without hardware.
+Requires `bleak` to be installed, as the driver module imports it.
+"""
+import contextlib
+
+import pylgbst.comms.cbleak as cbleak
+
+
+class FakeBleakConnection:
+    """
+    Stands in for `pylgbst.comms.cbleak.BleakConnection`, echoes every write back as notification
+    """
+
+    def __init__(self):
+        self._notify = None
+
+    async def connect(self, hub_mac=None, hub_name=None, **kwargs):
+        pass
+
+    async def set_notify_handler(self, inputs):
+        self._notify = inputs
+
+    async def write_char(self, characteristic_uuid, data):
+        pass
+
+    async def write(self, handle, data):
+        handler, resp_queue = self._notify
+        handler(handle, bytearray(data), resp_queue)
+
+
+@contextlib.contextmanager
+def fake_bleak_connection():
+    """
+    Makes `BleakDriver` use `FakeBleakConnection` instead of real BLE client
+    """
+    original = cbleak.BleakConnection
+    cbleak.BleakConnection = FakeBleakConnection
+    try:
+        yield
+    finally:
+        cbleak.BleakConnection = original
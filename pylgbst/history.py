@@ -0,0 +1,78 @@
+"""
+Sensor value history kept in preallocated numpy arrays, requires `numpy` to be installed
+"""
+import logging
+import threading
+
+import numpy
+
+log = logging.getLogger("history")
+
+
+class SensorHistory:
+    """
+    Fixed-capacity ring buffer of sensor values with their receipt timestamps.
+    Arrays are twice as long as capacity and every sample is written twice, so any window of latest samples
+    is a contiguous slice. Windows are returned as array views, they are not copied and may be overwritten
+    by new samples once `capacity` more samples arrive.
+    """
+
+    def __init__(self, capacity=1000, dtype=numpy.float64):
+        assert capacity > 0
+        self.capacity = capacity
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._timestamps = numpy.zeros(2 * capacity, dtype=numpy.int64)
+        self._values = None  # allocated by first sample, when number of values is known
+        self._pos = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._values = None
+            self._pos = 0
+            self._count = 0
+
+    def append(self, timestamp, values):
+        """
+        :param timestamp: `time.monotonic_ns()` of the sample
+        :type values: tuple
+        """
+        with self._lock:
+            if self._values is None or self._values.shape[1] != len(values):
+                if self._values is not None:
+                    log.debug("Number of values changed to %s, history is reset", len(values))
+                self._values = numpy.zeros((2 * self.capacity, len(values)), dtype=self.dtype)
+                self._pos = 0
+                self._count = 0
+
+            pos = self._pos
+            self._timestamps[pos] = self._timestamps[pos + self.capacity] = timestamp
+            self._values[pos] = self._values[pos + self.capacity] = values
+            self._pos = (pos + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def last(self, n=None):
+        """
+        :param n: number of latest samples, all available samples if None
+        :return: views of timestamps array and of values array, one row per sample, oldest first
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        with self._lock:
+            count = self._count if n is None else min(n, self._count)
+            end = self._pos + self.capacity
+            if self._values is None:
+                return self._timestamps[:0], numpy.zeros((0, 0), dtype=self.dtype)
+            return self._timestamps[end - count:end], self._values[end - count:end]
+
+    def since(self, timestamp):
+        """
+        :param timestamp: `time.monotonic_ns()` value, samples received at or after it are returned
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        timestamps, values = self.last()
+        start = numpy.searchsorted(timestamps, timestamp)
+        return timestamps[start:], values[start:]
@@ -1,10 +1,15 @@
+import asyncio
+import logging
 import threading
+import time
+from concurrent import futures
 
 from pylgbst import get_connection_auto
 from pylgbst.messages import *
 from pylgbst.peripherals import *
-from pylgbst.utilities import queue
-from pylgbst.utilities import str2hex, usbyte, ushort
+from pylgbst.capabilities import CapabilityCache
+from pylgbst.utilities import Dispatcher, LazyHex, LoopCallback, Subscriber, str2hex, usbyte, ushort, usint, \
+    version_str
 
 log = logging.getLogger("hub")
 
@@ -46,6 +51,228 @@ PERIPHERAL_TYPES = {
 }
 
 
+class HubProperties:
+    """
+    Typed values of hub properties, see `MsgHubProperties.value()`. Latest value of each property is cached
+    with its receipt timestamp. All subscribers of a property share single updates subscription on the hub.
+    """
+
+    # properties that hub can send updates of
+    UPDATABLE = (MsgHubProperties.ADVERTISE_NAME, MsgHubProperties.BUTTON, MsgHubProperties.RSSI,
+                 MsgHubProperties.VOLTAGE_PERC)
+
+    def __init__(self, hub):
+        """
+        :type hub: pylgbst.hub.Hub
+        """
+        self.hub = hub
+        self._values = {}  # property => (timestamp, value)
+        self._subscribers = {}  # property => frozenset of subscribers, replaced on change, present while subscribed
+        self._lock = threading.Lock()
+        hub.add_message_handler(MsgHubProperties, self._handle_update)
+
+    def last(self, prop):
+        """
+        :return: timestamp and value of latest received update, None if there was none
+        :rtype: tuple
+        """
+        return self._values.get(prop)
+
+    def get(self, prop, max_age=None):
+        """
+        Value is not requested from hub if property is subscribed, or if it is not older than `max_age` seconds
+        """
+        cached = self._cached(prop, max_age)
+        if cached is not None:
+            return cached[1]
+        return self.hub.send(MsgHubProperties(prop, MsgHubProperties.UPD_REQUEST)).value()
+
+    async def get_async(self, prop, max_age=None):
+        """Awaitable version of `get`"""
+        cached = self._cached(prop, max_age)
+        if cached is not None:
+            return cached[1]
+        return (await self.hub.send_async(MsgHubProperties(prop, MsgHubProperties.UPD_REQUEST))).value()
+
+    def _cached(self, prop, max_age):
+        cached = self._values.get(prop)
+        if cached is None:
+            return None
+
+        if prop in self._subscribers:
+            return cached  # hub notifies us on any change
+
+        if max_age is not None and time.monotonic_ns() - cached[0] <= max_age * 1e9:
+            return cached
+
+        return None
+
+    def subscribe(self, prop, callback, timestamps=False):
+        """
+        Callback gets property value on each update, with receipt timestamp in front of it if `timestamps` is set
+        """
+        assert prop in self.UPDATABLE, "Hub does not send updates of property 0x%x" % prop
+        enable = self._start_subscription(prop)
+        if enable:
+            try:
+                self.hub.send(enable)
+            except BaseException:
+                self._cancel_subscription(prop)
+                raise
+        if callback:
+            self._add_subscriber(prop, Subscriber(callback, timestamps))
+
+    async def subscribe_async(self, prop, callback, timestamps=False):
+        """Awaitable version of `subscribe`, callback is called in the running event loop"""
+        assert prop in self.UPDATABLE, "Hub does not send updates of property 0x%x" % prop
+        enable = self._start_subscription(prop)
+        if enable:
+            try:
+                await self.hub.send_async(enable)
+            except BaseException:
+                self._cancel_subscription(prop)
+                raise
+        if callback:
+            self._add_subscriber(prop, LoopCallback(asyncio.get_running_loop(), callback, timestamps))
+
+    def unsubscribe(self, prop, callback=None):
+        disable = self._remove_subscriber(prop, callback)
+        if disable:
+            self.hub.send(disable)
+
+    async def unsubscribe_async(self, prop, callback=None):
+        disable = self._remove_subscriber(prop, callback)
+        if disable:
+            await self.hub.send_async(disable)
+
+    def _start_subscription(self, prop):
+        """
+        :return: message that enables updates, if property is not subscribed yet
+        """
+        with self._lock:
+            if prop in self._subscribers:
+                return None
+            self._subscribers[prop] = frozenset()
+        return MsgHubProperties(prop, MsgHubProperties.UPD_ENABLE)
+
+    def _cancel_subscription(self, prop):
+        """
+        Forgets subscription that hub did not confirm, so cached value is not taken as up to date
+        and next subscriber enables updates again
+        """
+        with self._lock:
+            self._subscribers.pop(prop, None)
+
+    def _add_subscriber(self, prop, subscriber):
+        with self._lock:
+            self._subscribers[prop] = self._subscribers.get(prop, frozenset()) | {subscriber}
+
+    def _remove_subscriber(self, prop, callback):
+        """
+        :return: message that disables updates, if it was the last subscriber
+        """
+        with self._lock:
+            if prop not in self._subscribers:
+                return None
+
+            subscribers = self._subscribers[prop] - {callback}
+            if subscribers:
+                self._subscribers[prop] = subscribers
+                return None
+
+            del self._subscribers[prop]
+        return MsgHubProperties(prop, MsgHubProperties.UPD_DISABLE)
+
+    def _handle_update(self, msg):
+        """
+        :type msg: MsgHubProperties
+        """
+        if msg.operation != MsgHubProperties.UPSTREAM_UPDATE:
+            return
+
+        value = msg.value()
+        self._values[msg.property] = (msg.timestamp, value)
+        for subscriber in self._subscribers.get(msg.property, ()):
+            subscriber.notify((value,), msg.timestamp)
+
+
+class HubAlerts:
+    """
+    Alerts pushed by hub. Hub is asked to send updates of all alert types on first subscription,
+    received alerts are counted per type.
+    """
+
+    def __init__(self, hub):
+        """
+        :type hub: pylgbst.hub.Hub
+        """
+        self.hub = hub
+        self.counts = {atype: 0 for atype in MsgHubAlert.DESCR}  # number of raised alerts
+        self.active = {atype: False for atype in MsgHubAlert.DESCR}  # alert state from latest update
+        self._known = set()  # alert types updated since updates were enabled
+        self._subscribers = frozenset()  # replaced on change
+        self._enabled = False
+        self._lock = threading.Lock()
+        hub.add_message_handler(MsgHubAlert, self._handle_alert)
+
+    def get(self, atype):
+        """
+        :return: whether alert is raised, it is requested from hub unless alerts are subscribed and already updated
+        :rtype: bool
+        """
+        if self._enabled and atype in self._known:
+            return self.active[atype]  # hub notifies us on any change
+        return not self.hub.send(MsgHubAlert(atype, MsgHubAlert.UPD_REQUEST)).is_ok()
+
+    def subscribe(self, callback, timestamps=False):
+        """
+        Callback gets alert type and True when alert is raised, False when it is over
+        """
+        with self._lock:
+            enable = not self._enabled
+            if enable:
+                self._known.clear()
+            self._enabled = True
+            if callback:
+                self._subscribers |= {Subscriber(callback, timestamps)}
+
+        if enable:
+            try:
+                self._send_all(MsgHubAlert.UPD_ENABLE)
+            except BaseException:
+                with self._lock:
+                    self._enabled = False
+                raise
+
+    def unsubscribe(self, callback=None):
+        with self._lock:
+            self._subscribers -= {callback}
+            disable = self._enabled and not self._subscribers
+            if disable:
+                self._enabled = False
+
+        if disable:
+            self._send_all(MsgHubAlert.UPD_DISABLE)
+
+    def _send_all(self, operation):
+        for atype in MsgHubAlert.DESCR:
+            self.hub.send(MsgHubAlert(atype, operation))  # these have no replies, nothing to wait for
+
+    def _handle_alert(self, msg):
+        """
+        :type msg: MsgHubAlert
+        """
+        raised = not msg.is_ok()
+        if raised:
+            self.counts[msg.atype] = self.counts.get(msg.atype, 0) + 1
+            log.warning("Hub alert: %s", MsgHubAlert.DESCR.get(msg.atype, msg.atype))
+        self.active[msg.atype] = raised
+        self._known.add(msg.atype)
+
+        for subscriber in self._subscribers:
+            subscriber.notify((msg.atype, raised), msg.timestamp)
+
+
 class Hub:
     """
     :type connection: pylgbst.comms.Connection
@@ -53,18 +280,33 @@ class Hub:
     """
 
     HUB_HARDWARE_HANDLE = 0x0E
+    DISPATCH_WORKERS = 4  # max threads that handle port data of all hub's peripherals
+    EXPECTED_DEVICES = ()  # names of shorthand fields of builtin devices, constructor waits for them to attach
+    DEVICES_TIMEOUT = 10.0  # seconds to wait for expected devices
+    COMPLETION_TIMEOUT = 60.0  # seconds to wait for completion of accepted command, beyond default timeout
 
-    def __init__(self, connection=None):
+    def __init__(self, connection=None, timeout=None):
+        """
+        :param timeout: default seconds to wait for sync replies, None means wait forever
+        """
         self._msg_handlers = []
+        self._handlers_index = {}  # message class => its handlers, filled on first message of that class
+        self._port_handlers = {}  # (message class, port) => handlers of that port's messages
+        self._handlers_lock = threading.Lock()
         self.peripherals = {}
-        self._sync_request = None
-        self._sync_replies = queue.Queue(1)
+        self.timeout = timeout
+        self._sync_requests = []  # pending (request, reply future) pairs, oldest first
         self._sync_lock = threading.Lock()
+        self.dispatcher = Dispatcher(self.DISPATCH_WORKERS, "Hub dispatcher")
+        self.tracer = None  # optional callable(direction, handle, data, msg), gets every sent and received message
+        self._devices_cond = threading.Condition()
+        self.properties = HubProperties(self)
+        self.alerts = HubAlerts(self)
+        self.capability_cache = CapabilityCache()  # set to None to always query port capabilities from hub
 
         self.add_message_handler(MsgHubAttachedIO, self._handle_device_change)
+        self.add_message_handler(MsgHubAttachedIO, self._signal_device_change)  # after subclasses set their fields
         self.add_message_handler(MsgPortOutputFeedback, self._handle_output_feedback)
-        self.add_message_handler(MsgPortValueSingle, self._handle_sensor_data)
-        self.add_message_handler(MsgPortValueCombined, self._handle_sensor_data)
         self.add_message_handler(MsgGenericError, self._handle_error)
         self.add_message_handler(MsgHubAction, self._handle_action)
 
@@ -79,65 +321,228 @@ class Hub:
             self.connection.disconnect()
 
     def add_message_handler(self, classname, callback):
-        self._msg_handlers.append((classname, callback))
+        with self._handlers_lock:
+            self._msg_handlers.append((classname, callback))
+            # lists are replaced, not changed in place, so notification thread can iterate them without locking
+            self._handlers_index = {
+                msg_class: handlers + [callback] if issubclass(msg_class, classname) else handlers
+                for msg_class, handlers in self._handlers_index.items()
+            }
+
+    def remove_message_handler(self, classname, callback):
+        with self._handlers_lock:
+            self._msg_handlers = [x for x in self._msg_handlers if x != (classname, callback)]
+            self._handlers_index = {}
+
+    def add_port_handler(self, classname, port, callback):
+        """
+        Routes messages of exact class `classname` that relate to `port` into callback
+        """
+        with self._handlers_lock:
+            key = (classname, port)
+            handlers = dict(self._port_handlers)
+            handlers[key] = handlers.get(key, []) + [callback]
+            self._port_handlers = handlers
+
+    def remove_port_handler(self, classname, port, callback):
+        with self._handlers_lock:
+            key = (classname, port)
+            handlers = dict(self._port_handlers)
+            handlers[key] = [x for x in handlers.get(key, []) if x != callback]
+            if not handlers[key]:
+                del handlers[key]
+            self._port_handlers = handlers
+
+    def _get_handlers(self, msg_class):
+        with self._handlers_lock:
+            if msg_class not in self._handlers_index:
+                handlers = [handler for cls, handler in self._msg_handlers if issubclass(msg_class, cls)]
+                index = dict(self._handlers_index)
+                index[msg_class] = handlers
+                self._handlers_index = index
+            return self._handlers_index[msg_class]
+
+    def send(self, msg, timeout=None):
+        """
+        :type msg: pylgbst.messages.DownstreamMsg
+        :param timeout: seconds to wait for reply; if None, hub's default timeout bounds only the wait for
+            hub to accept the request, accepted motor command is then waited for `COMPLETION_TIMEOUT` more
+        :raises TimeoutError: when reply has not arrived in time, pending request is dropped then
+        :rtype: pylgbst.messages.UpstreamMsg
+        """
+        reply = self.send_request(msg)
+        if reply is None:
+            return None
+        return self._wait_reply(msg, reply, timeout)
 
-    def send(self, msg):
+    def _wait_reply(self, msg, reply, timeout=None):
+        """
+        Waits for reply to request sent with `send_request`, see `send` for timeout handling
+        """
+        wait = self.timeout if timeout is None else timeout
+        try:
+            resp = reply.result(wait)
+        except futures.TimeoutError:
+            if timeout is not None or not msg.is_acked:
+                reply.cancel()
+                raise TimeoutError("No reply to %r within %ss" % (msg, wait))
+            try:
+                resp = reply.result(self.COMPLETION_TIMEOUT)  # accepted command may take long to complete
+            except futures.TimeoutError:
+                reply.cancel()
+                raise TimeoutError("%r has not completed within %ss" % (msg, wait + self.COMPLETION_TIMEOUT))
+
+        log.debug("Fetched sync reply: %r", resp)
+        return resp
+
+    async def send_async(self, msg, timeout=None):
         """
+        Awaitable version of `send`, can be used from any event loop
+
         :type msg: pylgbst.messages.DownstreamMsg
         :rtype: pylgbst.messages.UpstreamMsg
         """
-        log.debug("Send message: %r", msg)
+        reply = self.send_request(msg)
+        if reply is None:
+            return None
+
+        wait = self.timeout if timeout is None else timeout
+        awaitable = asyncio.wrap_future(reply)
+        try:
+            resp = await asyncio.wait_for(asyncio.shield(awaitable), wait)
+        except asyncio.TimeoutError:
+            if timeout is not None or not msg.is_acked:
+                reply.cancel()
+                raise TimeoutError("No reply to %r within %ss" % (msg, wait))
+            try:
+                resp = await asyncio.wait_for(awaitable, self.COMPLETION_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError("%r has not completed within %ss" % (msg, wait + self.COMPLETION_TIMEOUT))
+
+        log.debug("Fetched sync reply: %r", resp)
+        return resp
+
+    def send_request(self, msg):
+        """
+        Sends message without waiting for its reply
+
+        :type msg: pylgbst.messages.DownstreamMsg
+        :return: future of the reply, cancel it to drop pending request; None if message needs no reply
+        :rtype: concurrent.futures.Future
+        """
         msgbytes = msg.bytes()
-        if msg.needs_reply:
-            with self._sync_lock:
-                assert not self._sync_request, "Pending request %r while trying to put %r" % (self._sync_request, msg)
-                self._sync_request = msg
-                log.debug("Waiting for sync reply to %r...", msg)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Send message: %r", msg)
+        if self.tracer is not None:
+            self.tracer("out", self.HUB_HARDWARE_HANDLE, msgbytes, msg)
 
-            self.connection.write(self.HUB_HARDWARE_HANDLE, msgbytes)
-            resp = self._sync_replies.get()
-            log.debug("Fetched sync reply: %r", resp)
-            if isinstance(resp, MsgGenericError):
-                raise RuntimeError(resp.message())
-            return resp
-        else:
+        if not msg.needs_reply:
             self.connection.write(self.HUB_HARDWARE_HANDLE, msgbytes)
             return None
 
-    def _notify(self, handle, data):
-        log.debug("Notification on %s: %s", handle, str2hex(data))
+        reply = futures.Future()
+        with self._sync_lock:
+            self._sync_requests.append((msg, reply))
+        reply.add_done_callback(lambda _: self._drop_request(reply))
 
-        msg = self._get_upstream_msg(data)
+        try:
+            self.connection.write(self.HUB_HARDWARE_HANDLE, msgbytes)
+        except BaseException:
+            reply.cancel()
+            raise
+        return reply
+
+    def _drop_request(self, reply):
+        with self._sync_lock:
+            self._sync_requests = [x for x in self._sync_requests if x[1] is not reply]
+
+    def _resolve_request(self, matcher, msg):
+        with self._sync_lock:
+            for pending in self._sync_requests:
+                if matcher(pending[0]):
+                    self._sync_requests.remove(pending)
+                    break
+            else:
+                return False
+
+        reply = pending[1]
+        if reply.set_running_or_notify_cancel():  # it might get cancelled meanwhile
+            if isinstance(msg, MsgGenericError):
+                reply.set_exception(RuntimeError(msg.message()))
+            else:
+                reply.set_result(msg)
+        return True
 
+    def _ack_request(self, msg):
+        """
+        Marks the oldest pending request accepted by upstream message, so command errors are not matched to it
+        """
         with self._sync_lock:
-            if self._sync_request:
-                if self._sync_request.is_reply(msg):
-                    log.debug("Found matching upstream msg: %r", msg)
-                    self._sync_replies.put(msg)
-                    self._sync_request = None
-
-        for msg_class, handler in self._msg_handlers:
-            if isinstance(msg, msg_class):
+            for request, _ in self._sync_requests:
+                if not request.is_acked and request.is_ack(msg):
+                    request.is_acked = True
+                    return True
+        return False
+
+    def _notify(self, handle, data, timestamp=None):
+        """
+        :param timestamp: `time.monotonic_ns()` of data receipt, if connection has it
+        """
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+
+        debug = log.isEnabledFor(logging.DEBUG)  # formatting messages is the most costly part of notification
+        if debug:
+            log.debug("Notification on %s: %s", handle, LazyHex(data))
+
+        msg = self._get_upstream_msg(data)
+        msg.timestamp = timestamp
+        if debug:
+            log.debug("Decoded message: %r", msg)
+        if self.tracer is not None:
+            self.tracer("in", handle, data, msg)
+
+        if msg.__class__ is MsgPortOutputFeedback and len(msg.feedbacks) > 1:
+            for part in msg.split():  # each port's feedback completes its own request
+                self._dispatch(part, debug)
+        else:
+            self._dispatch(msg, debug)
+
+    def _dispatch(self, msg, debug):
+        """
+        Resolves pending request with upstream message and passes it to handlers
+        """
+        if self._resolve_request(lambda request: request.is_reply(msg), msg):
+            if debug:
+                log.debug("Found matching upstream msg: %r", msg)
+        elif msg.__class__ is MsgPortOutputFeedback:
+            self._ack_request(msg)
+
+        handlers = self._handlers_index.get(msg.__class__)
+        if handlers is None:
+            handlers = self._get_handlers(msg.__class__)
+
+        for handler in handlers:
+            if debug:
                 log.debug("Handling msg with %s: %r", handler, msg)
+            handler(msg)
+
+        port = getattr(msg, "port", None)
+        if port is not None:
+            for handler in self._port_handlers.get((msg.__class__, port), ()):
+                if debug:
+                    log.debug("Handling port msg with %s: %r", handler, msg)
                 handler(msg)
 
     def _get_upstream_msg(self, data):
-        msg_type = usbyte(data, 2)
-        msg = None
-        for msg_kind in UPSTREAM_MSGS:
-            if msg_type == msg_kind.TYPE:
-                msg = msg_kind.decode(data)
-                log.debug("Decoded message: %r", msg)
-                break
-        assert msg
-        return msg
+        msg_kind = UPSTREAM_MSGS_BY_TYPE.get(usbyte(data, 2))
+        assert msg_kind, "Unknown message type: %s" % str2hex(data)
+        return msg_kind.decode(data)
 
     def _handle_error(self, msg):
         log.warning("Command error: %s", msg.message())
-        with self._sync_lock:
-            if self._sync_request:
-                self._sync_request = None
-                self._sync_replies.put(msg)
+        # error refers to the oldest pending request of that command type, which hub has not accepted yet
+        self._resolve_request(lambda request: request.TYPE == msg.cmd and not request.is_acked, msg)
 
     def _handle_action(self, msg):
         """
@@ -156,7 +561,7 @@ class Hub:
                 log.warning("Strange: got detach command for port %s that is not attached, will ignore it", msg.port)
             else:
                 log.info("Detaching peripheral: %s", self.peripherals[msg.port])
-                self.peripherals.pop(msg.port)
+                self.peripherals.pop(msg.port).detach()
             return
 
         assert msg.event in (msg.EVENT_ATTACHED, msg.EVENT_ATTACHED_VIRTUAL)
@@ -164,6 +569,10 @@ class Hub:
         dev_type_raw = ushort(msg.payload, 0)
         dev_type = DevTypes(dev_type_raw) if DevTypes.has_value(dev_type_raw) else DevTypes.UNKNOWN
 
+        if port in self.peripherals:
+            log.warning("Got attach command for port %s that is already attached, replacing", port)
+            self.peripherals.pop(port).detach()
+
         if dev_type in PERIPHERAL_TYPES:
             self.peripherals[port] = PERIPHERAL_TYPES[dev_type](self, port)
         else:
@@ -173,37 +582,43 @@ class Hub:
             self.peripherals[port] = Peripheral(self, port)
 
         log.info("Attached peripheral %s => %s", DevTypes(dev_type).name, self.peripherals[msg.port])
+        self.peripherals[port].dev_type = dev_type_raw
 
         if msg.event == msg.EVENT_ATTACHED:
-            hw_revision = reversed([usbyte(msg.payload, x) for x in range(2, 6)])
-            sw_revision = reversed([usbyte(msg.payload, x) for x in range(6, 10)])
-            # what to do with this info? it's useless, I guess
-            del hw_revision, sw_revision
+            self.peripherals[port].hw_revision = version_str(usint(msg.payload, 2))
+            self.peripherals[port].sw_revision = version_str(usint(msg.payload, 6))
         elif msg.event == msg.EVENT_ATTACHED_VIRTUAL:
             self.peripherals[port].virtual_ports = (usbyte(msg.payload, 2), usbyte(msg.payload, 3))
 
-    def _handle_output_feedback(self, msg):
-        assert isinstance(msg, MsgPortOutputFeedback)
-        if msg.port not in self.peripherals:
-            log.warning("Notification on port with no device: %s", msg.port)
-            return
+    def _signal_device_change(self, msg):
+        with self._devices_cond:
+            self._devices_cond.notify_all()
 
-        device = self.peripherals[msg.port]
-        if hasattr(device, "cmd_in_progress"):
-            device.cmd_in_progress = msg.is_in_progress()
-            if device.cmd_in_progress:
-                log.debug("Command on device %s in progress.", device)
-            else:
-                log.debug("Command on device %s completed.", device)
+    def _wait_for_devices(self, get_dev_set=None, timeout=None):
+        """
+        Waits until builtin devices are attached
+
+        :param get_dev_set: callable returning devices to wait for, fields from `EXPECTED_DEVICES` by default
+        :param timeout: seconds to wait, `DEVICES_TIMEOUT` is used if None
+        :return: True if all devices are present
+        """
+        if not get_dev_set:
+            get_dev_set = lambda: [getattr(self, name) for name in self.EXPECTED_DEVICES]
+
+        if timeout is None:
+            timeout = self.DEVICES_TIMEOUT
 
-    def _handle_sensor_data(self, msg):
-        assert isinstance(msg, (MsgPortValueSingle, MsgPortValueCombined))
+        with self._devices_cond:
+            if self._devices_cond.wait_for(lambda: all(get_dev_set()), timeout):
+                log.debug("All devices are present: %s", get_dev_set())
+                return True
+        log.warning("Got only these devices: %s", get_dev_set())
+        return False
+
+    def _handle_output_feedback(self, msg):
+        assert isinstance(msg, MsgPortOutputFeedback)
         if msg.port not in self.peripherals:
             log.warning("Notification on port with no device: %s", msg.port)
-            return
-
-        device = self.peripherals[msg.port]
-        device.queue_port_data(msg)
 
     def disconnect(self):
         self.send(MsgHubAction(MsgHubAction.DISCONNECT))
@@ -231,6 +646,9 @@ class MoveHub(Hub):
     """
 
     DEFAULT_NAME = "LEGO Move Hub"
+    EXPECTED_DEVICES = ("motor_A", "motor_B", "motor_AB", "led", "tilt_sensor", "current", "voltage")
+    CONSTANT_INFO = ("name", "mac")  # `fetch_info` keys that are requested only once
+    BATTERY_MAX_AGE = 10.0  # seconds that received battery level is served by `voltage_level` without request
 
     # PORTS
     PORT_A = 0x00
@@ -244,16 +662,14 @@ class MoveHub(Hub):
     PORT_VOLTAGE = 0x3C
 
     # noinspection PyTypeChecker
-    def __init__(self, connection=None):
+    def __init__(self, connection=None, timeout=None):
         self._comm_lock = threading.RLock()
         if connection is None:
             connection = get_connection_auto(hub_name=self.DEFAULT_NAME)
 
-        super().__init__(connection)
-        self.info = {}
+        self.info = {}  # name and MAC address once fetched, see `fetch_info`
 
-        # shorthand fields
-        self.button = Button(self)
+        # shorthand fields, they have to exist before attach notifications start to come
         self.led = None
         self.current = None
         self.voltage = None
@@ -266,36 +682,81 @@ class MoveHub(Hub):
         self.port_C = None
         self.port_D = None
 
+        super().__init__(connection, timeout)
+        self.button = Button(self)
+
         self._wait_for_devices()
-        self._report_status()
 
-    def _wait_for_devices(self, get_dev_set=None):
-        if not get_dev_set:
-            get_dev_set = lambda: (self.motor_A, self.motor_B, self.motor_AB, self.led, self.tilt_sensor,
-                                   self.current, self.voltage)
-        for num in range(0, 100):
-            devices = get_dev_set()
-            if all(devices):
-                log.debug("All devices are present: %s", devices)
-                return
-            log.debug("Waiting for builtin devices to appear: %s", devices)
-            time.sleep(0.1)
-        log.warning("Got only these devices: %s", get_dev_set())
+    @property
+    def name(self):
+        """
+        :rtype: str
+        """
+        return self.fetch_info(["name"])["name"]
 
-    def _report_status(self):
-        # maybe add firmware version
-        name = self.send(MsgHubProperties(MsgHubProperties.ADVERTISE_NAME, MsgHubProperties.UPD_REQUEST))
-        mac = self.send(MsgHubProperties(MsgHubProperties.PRIMARY_MAC, MsgHubProperties.UPD_REQUEST))
-        log.info("%s on %s", name.payload, str2hex(mac.payload))
+    @property
+    def mac(self):
+        """
+        :rtype: str
+        """
+        return self.fetch_info(["mac"])["mac"]
 
-        voltage = self.send(MsgHubProperties(MsgHubProperties.VOLTAGE_PERC, MsgHubProperties.UPD_REQUEST))
-        assert isinstance(voltage, MsgHubProperties)
-        log.info("Voltage: %s%%", usbyte(voltage.parameters, 0))
+    @property
+    def voltage_level(self):
+        """
+        :return: battery level in percents, requested from hub if cached one is older than `BATTERY_MAX_AGE`
+        :rtype: int
+        """
+        return self.properties.get(MsgHubProperties.VOLTAGE_PERC, max_age=self.BATTERY_MAX_AGE)
 
-        voltage = self.send(MsgHubAlert(MsgHubAlert.LOW_VOLTAGE, MsgHubAlert.UPD_REQUEST))
-        assert isinstance(voltage, MsgHubAlert)
-        if not voltage.is_ok():
-            log.warning("Low voltage, check power source (maybe replace battery)")
+    @property
+    def low_voltage(self):
+        """
+        :rtype: bool
+        """
+        return self.alerts.get(MsgHubAlert.LOW_VOLTAGE)
+
+    def fetch_info(self, keys=("name", "mac", "voltage_level", "low_voltage"), timeout=None):
+        """
+        Requests hub info values, all requests are sent before waiting for replies.
+        Name and MAC address don't change, so they are requested only once and kept in `info`.
+
+        :return: dict of requested values
+        :rtype: dict
+        """
+        requests = {key: self._info_request(key) for key in keys if key not in self.info}
+        replies = {key: self.send_request(msg) for key, msg in requests.items()}
+        values = {}
+        try:
+            for key, reply in replies.items():
+                values[key] = self._decode_info(key, self._wait_reply(requests[key], reply, timeout))
+        finally:
+            for reply in replies.values():
+                reply.cancel()
+
+        self.info.update((key, values[key]) for key in self.CONSTANT_INFO if key in values)
+        return {key: values[key] if key in values else self.info[key] for key in keys}
+
+    @staticmethod
+    def _info_request(key):
+        if key == "low_voltage":
+            return MsgHubAlert(MsgHubAlert.LOW_VOLTAGE, MsgHubAlert.UPD_REQUEST)
+
+        props = {
+            "name": MsgHubProperties.ADVERTISE_NAME,
+            "mac": MsgHubProperties.PRIMARY_MAC,
+            "voltage_level": MsgHubProperties.VOLTAGE_PERC,
+        }
+        return MsgHubProperties(props[key], MsgHubProperties.UPD_REQUEST)
+
+    @staticmethod
+    def _decode_info(key, msg):
+        if key == "low_voltage":
+            assert isinstance(msg, MsgHubAlert)
+            return not msg.is_ok()
+
+        assert isinstance(msg, MsgHubProperties)
+        return msg.value()
 
     # noinspection PyTypeChecker
     def _handle_device_change(self, msg):
@@ -348,6 +809,7 @@ class SmartHub(Hub):
     """
 
     DEFAULT_NAME = "Smart Hub"
+    EXPECTED_DEVICES = ("led", "current", "voltage")
 
     # PORTS
     PORT_A = 0x00
@@ -356,33 +818,20 @@ class SmartHub(Hub):
     PORT_CURRENT = 0x3B
     PORT_VOLTAGE = 0x3C
 
-    def __init__(self, connection=None):
+    def __init__(self, connection=None, timeout=None):
         if connection is None:
             connection = get_connection_auto(hub_name=self.DEFAULT_NAME)
 
-        super().__init__(connection)
-
-        self.button = Button(self)
         self.led = None
         self.port_A = None
         self.port_B = None
         self.current = None
         self.voltage = None
 
-        self._wait_for_devices()
+        super().__init__(connection, timeout)
+        self.button = Button(self)
 
-    def _wait_for_devices(self, get_dev_set=None):
-        if not get_dev_set:
-            get_dev_set = lambda: (self.led, self.current, self.voltage)
-
-        for num in range(0, 100):
-            devices = get_dev_set()
-            if all(devices):
-                log.debug("All devices are present: %s", devices)
-                return
-            log.debug("Waiting for builtin devices to appear: %s", devices)
-            time.sleep(0.1)
-        log.warning("Got only these devices: %s", get_dev_set())
+        self._wait_for_devices()
 
     # noinspection PyTypeChecker
     def _handle_device_change(self, msg):
@@ -416,6 +865,7 @@ class RemoteHandset(Hub):
     """
 
     DEFAULT_NAME = "Remote Handset"
+    EXPECTED_DEVICES = ("port_A", "port_B", "port_RSSI", "led", "voltage")
 
     # PORTS
     PORT_A = 0x00
@@ -424,32 +874,19 @@ class RemoteHandset(Hub):
     PORT_VOLTAGE = 0x3B
     PORT_RSSI = 0x3C
 
-    def __init__(self, connection=None, address=None):
+    def __init__(self, connection=None, address=None, timeout=None):
         if connection is None:
             connection = get_connection_auto(hub_mac=address, hub_name=self.DEFAULT_NAME)
 
-        super().__init__(connection)
-
         self.led = None
         self.port_A = None
         self.port_B = None
         self.port_RSSI = None
         self.voltage = None
 
-        self._wait_for_devices()
+        super().__init__(connection, timeout)
 
-    def _wait_for_devices(self, get_dev_set=None):
-        if not get_dev_set:
-            get_dev_set = lambda: (self.port_A, self.port_B, self.port_RSSI, self.led, self.voltage)
-
-        for num in range(0, 100):
-            devices = get_dev_set()
-            if all(devices):
-                log.debug("All devices are present: %s", devices)
-                return
-            log.debug("Waiting for builtin devices to appear: %s", devices)
-            time.sleep(0.1)
-        log.warning("Got only these devices: %s", get_dev_set())
+        self._wait_for_devices()
 
     # noinspection PyTypeChecker
     def _handle_device_change(self, msg):
@@ -1,18 +1,50 @@
 import logging
 from enum import Enum, unique
-from struct import pack, unpack
+from struct import Struct
 
-from pylgbst.utilities import str2hex
+from pylgbst.utilities import str2hex, version_str
 
 log = logging.getLogger("hub")
 
+_BYTE = Struct("<B")
+_SHORT = Struct("<H")
+_LONG = Struct("<I")
+_FLOAT = Struct("<f")
+_SBYTE = Struct("<b")
+
+_HEADER = Struct("<BBB")
+_TWO_BYTES = Struct("<BB")
+_THREE_BYTES = Struct("<BBB")
+_INPUT_FMT_SETUP = Struct("<BBIB")
+_OUTPUT_HEADER = Struct("<BBBBBB")  # common header, port, startup and completion flags, subcommand
+
 
 class Message:
+    """
+    Messages are created for every notification, so all of them are slotted to keep instances small.
+    Subclasses have to declare `__slots__` for their own fields.
+    """
+
     TYPE = None
 
+    __slots__ = ("hub_id", "timestamp", "_data", "_offset")
+
     def __init__(self):
         self.hub_id = 0x00  # not used according to official doc
-        self.payload = b""
+        self._data = b""
+        self._offset = 0
+
+    @property
+    def payload(self):
+        """
+        Reading payload does not change message, as it may be read from several threads at once
+        """
+        return self._data[self._offset:] if self._offset else self._data
+
+    @payload.setter
+    def payload(self, value):
+        self._data = value
+        self._offset = 0
 
     def bytes(self):
         """
@@ -20,38 +52,65 @@ class Message:
         """
         msglen = len(self.payload) + 3
         assert msglen < 127, "TODO: handle longer messages with 2-byte len"
-        return pack("<B", msglen) + pack("<B", self.hub_id) + pack("<B", self.TYPE) + self.payload
+        return _HEADER.pack(msglen, self.hub_id, self.TYPE) + self.payload
+
+    def _fields(self):
+        for cls in reversed(type(self).__mro__):
+            for name in cls.__dict__.get("__slots__", ()):
+                if not name.startswith("_") and hasattr(self, name):
+                    yield name, getattr(self, name)
 
     def __repr__(self):
         # assert self.bytes()  # to trigger any field changes
-        data = self.__dict__
+        data = dict(self._fields())
+        data["payload"] = self.payload  # might be kept behind decoding cursor
         data = {
             x: (str2hex(y) if isinstance(y, bytes) else y)
             for x, y in data.items()
-            if x not in ("hub_id",)
+            if x not in ("hub_id", "timestamp")
         }
         return self.__class__.__name__ + "(%s)" % data
 
 
 class DownstreamMsg(Message):
+    __slots__ = ("needs_reply", "is_acked")
+
     def __init__(self):
         super().__init__()
         self.needs_reply = False
+        self.is_acked = False  # hub accepted the request, but its reply is still to come
 
     def is_reply(self, msg):
         del msg
         return False
 
+    def is_ack(self, msg):
+        """
+        :return: whether upstream message tells the request was accepted, without being its final reply
+        """
+        del msg
+        return False
+
 
 class UpstreamMsg(Message):
+    """
+    Fields are decoded by moving cursor along message data, without copying the rest of data for each field.
+    `payload` is the part of data after cursor. Decoded message is shared by threads, so it must not change
+    after `decode`, reading its fields and payload changes nothing.
+    """
+
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
+        self.timestamp = None  # time.monotonic_ns() of receipt, in nanoseconds
 
     @classmethod
     def decode(cls, data):
         """
         see https://lego.github.io/lego-ble-wireless-protocol-docs/#common-message-header
         """
+        assert isinstance(data, (bytes, bytearray))
         msg = cls()
         msg.payload = data
         msglen = msg._byte()
@@ -60,25 +119,27 @@ class UpstreamMsg(Message):
         assert hub_id == 0
         msg_type = msg._byte()
         assert cls.TYPE == msg_type, "Message type does not match: %x!=%x" % (cls.TYPE, msg_type)
-        assert isinstance(msg.payload, (bytes, bytearray))
         return msg
 
-    def __shift(self, vtype, vlen):
-        val = self.payload[0:vlen]
-        self.payload = self.payload[vlen:]
-        return unpack("<" + vtype, val)[0]
+    def __shift(self, fmt):
+        val = fmt.unpack_from(self._data, self._offset)[0]
+        self._offset += fmt.size
+        return val
+
+    def _remaining(self):
+        return len(self._data) - self._offset
 
     def _byte(self):
-        return self.__shift("B", 1)
+        return self.__shift(_BYTE)
 
     def _short(self):
-        return self.__shift("H", 2)
+        return self.__shift(_SHORT)
 
     def _long(self):
-        return self.__shift("I", 4)
+        return self.__shift(_LONG)
 
     def _float(self):
-        return self.__shift("f", 4)
+        return self.__shift(_FLOAT)
 
     def _bits_list(self, val):
         res = []
@@ -97,6 +158,8 @@ class MsgHubProperties(DownstreamMsg, UpstreamMsg):
 
     TYPE = 0x01
 
+    __slots__ = ("property", "operation", "parameters")
+
     ADVERTISE_NAME = 0x01
     BUTTON = 0x02
     FW_VERSION = 0x03
@@ -130,7 +193,7 @@ class MsgHubProperties(DownstreamMsg, UpstreamMsg):
     def bytes(self):
         if self.operation in (self.UPD_REQUEST, self.UPD_ENABLE):
             self.needs_reply = True
-        self.payload = pack("<B", self.property) + pack("<B", self.operation) + self.parameters
+        self.payload = _TWO_BYTES.pack(self.property, self.operation) + self.parameters
         return super().bytes()
 
     @classmethod
@@ -149,6 +212,26 @@ class MsgHubProperties(DownstreamMsg, UpstreamMsg):
             and msg.property == self.property
         )
 
+    def value(self):
+        """
+        :return: `parameters` decoded according to property type: str for names and versions, "xx:xx:..." for MACs,
+            int for others
+        """
+        params = self.parameters
+        if self.property in (self.ADVERTISE_NAME, self.MANUFACTURER, self.RADIO_FW_VERSION):
+            return params.rstrip(b"\x00").decode("ascii")
+        elif self.property in (self.FW_VERSION, self.HW_VERSION):
+            return version_str(_LONG.unpack_from(params)[0])
+        elif self.property == self.WIRELESS_PROTO_VERSION:
+            ver = _SHORT.unpack_from(params)[0]
+            return "%x.%02x" % (ver >> 8, ver & 0xFF)
+        elif self.property in (self.PRIMARY_MAC, self.SECONDARY_MAC):
+            return ":".join("%02x" % x for x in params)
+        elif self.property == self.RSSI:
+            return _SBYTE.unpack_from(params)[0]  # dBm
+        else:
+            return _BYTE.unpack_from(params)[0]
+
 
 class MsgHubAction(DownstreamMsg, UpstreamMsg):
     """
@@ -157,6 +240,8 @@ class MsgHubAction(DownstreamMsg, UpstreamMsg):
 
     TYPE = 0x02
 
+    __slots__ = ("action",)
+
     SWITCH_OFF = 0x01
     DISCONNECT = 0x02
     VCC_PORT_CONTROL_ON = 0x03
@@ -174,19 +259,22 @@ class MsgHubAction(DownstreamMsg, UpstreamMsg):
         self.action = action
 
     def bytes(self):
-        self.payload = pack("<B", self.action)
+        self.payload = _BYTE.pack(self.action)
         self.needs_reply = self.action in (self.DISCONNECT, self.SWITCH_OFF)
         return super().bytes()
 
     def is_reply(self, msg):
         if not isinstance(msg, MsgHubAction):
-            raise TypeError("Unexpected message type: %s" % (msg.__class__,))
+            return False
+
         if self.action == self.DISCONNECT and msg.action == self.UPSTREAM_DISCONNECT:
             return True
 
         if self.action == self.SWITCH_OFF and msg.action == self.UPSTREAM_SHUTDOWN:
             return True
 
+        return False
+
     @classmethod
     def decode(cls, data):
         msg = super().decode(data)
@@ -202,6 +290,8 @@ class MsgHubAlert(DownstreamMsg, UpstreamMsg):
 
     TYPE = 0x03
 
+    __slots__ = ("atype", "operation", "status")
+
     LOW_VOLTAGE = 0x01
     HIGH_CURRENT = 0x02
     LOW_SIGNAL = 0x03
@@ -226,7 +316,7 @@ class MsgHubAlert(DownstreamMsg, UpstreamMsg):
         self.status = None
 
     def bytes(self):
-        self.payload = pack("<B", self.atype) + pack("<B", self.operation)
+        self.payload = _TWO_BYTES.pack(self.atype, self.operation)
         if self.operation == self.UPD_REQUEST:
             self.needs_reply = True
         return super().bytes()
@@ -313,6 +403,8 @@ class MsgHubAttachedIO(UpstreamMsg):
 
     TYPE = 0x04
 
+    __slots__ = ("port", "event")
+
     EVENT_DETACHED = 0x00
     EVENT_ATTACHED = 0x01
     EVENT_ATTACHED_VIRTUAL = 0x02
@@ -338,6 +430,8 @@ class MsgGenericError(UpstreamMsg):
 
     TYPE = 0x05
 
+    __slots__ = ("cmd", "err")
+
     ERR_ACK = 0x01  # ACK
     ERR_MACK = 0x02  # MACK
     ERR_BUFFER_OVERFLOW = 0x03  # Buffer Overflow
@@ -383,6 +477,8 @@ class MsgPortInfoRequest(DownstreamMsg):
 
     TYPE = 0x21
 
+    __slots__ = ("port", "info_type")
+
     INFO_PORT_VALUE = 0x00
     INFO_MODE_INFO = 0x01
     INFO_MODE_COMBINATIONS = 0x02
@@ -394,11 +490,11 @@ class MsgPortInfoRequest(DownstreamMsg):
         self.needs_reply = True
 
     def bytes(self):
-        self.payload = pack("<B", self.port) + pack("<B", self.info_type)
+        self.payload = _TWO_BYTES.pack(self.port, self.info_type)
         return super().bytes()
 
     def is_reply(self, msg):
-        if msg.port != self.port:
+        if not isinstance(msg, (MsgPortValueSingle, MsgPortValueCombined, MsgPortInfo)) or msg.port != self.port:
             return False
 
         if self.info_type == self.INFO_PORT_VALUE:
@@ -414,6 +510,8 @@ class MsgPortModeInfoRequest(DownstreamMsg):
 
     TYPE = 0x22
 
+    __slots__ = ("port", "mode", "info_type")
+
     INFO_NAME = 0x00
     INFO_RAW_RANGE = 0x01
     INFO_PCT_RANGE = 0x02
@@ -442,7 +540,7 @@ class MsgPortModeInfoRequest(DownstreamMsg):
         self.port = port
         self.mode = mode
         self.info_type = info_type
-        self.payload = pack("<B", port) + pack("<B", mode) + pack("<B", info_type)
+        self.payload = _THREE_BYTES.pack(port, mode, info_type)
         self.needs_reply = True
 
     def is_reply(self, msg):
@@ -466,13 +564,15 @@ class MsgPortInputFmtSetupSingle(DownstreamMsg):
 
     TYPE = 0x41
 
+    __slots__ = ("port", "mode", "updates_enabled", "update_delta")
+
     def __init__(self, port, mode, delta=1, update_enable=0):
         super().__init__()
         self.port = port
         self.mode = mode
         self.updates_enabled = update_enable
         self.update_delta = delta
-        self.payload = pack("<B", port) + pack("<B", mode) + pack("<I", delta) + pack("<B", update_enable)
+        self.payload = _INPUT_FMT_SETUP.pack(port, mode, delta, update_enable)
         self.needs_reply = True
 
     def is_reply(self, msg):
@@ -483,14 +583,34 @@ class MsgPortInputFmtSetupSingle(DownstreamMsg):
 class MsgPortInputFmtSetupCombined(DownstreamMsg):
     """
     https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#port-input-format-setup-combinedmode
+    Setup sequence is: lock device, setup each mode with single mode message, set combination, unlock.
     """
     TYPE = 0x42
 
-    def __init__(self, port, mode, delta=1, update_enable=0):
+    __slots__ = ("port", "subcommand", "params")
+
+    SUBCMD_SET_COMBINATION = 0x01
+    SUBCMD_LOCK = 0x02
+    SUBCMD_UNLOCK_MULTI_UPDATE = 0x03
+    SUBCMD_UNLOCK = 0x04
+    SUBCMD_RESET = 0x06
+
+    def __init__(self, port, subcommand, params=b""):
         super().__init__()
         self.port = port
-        self.payload = pack("<B", port) + pack("<B", mode) + pack("<I", delta) + pack("<B", update_enable)
-        self.needs_reply = True
+        self.subcommand = subcommand
+        self.params = params
+        self.payload = _TWO_BYTES.pack(port, subcommand) + params
+        # only unlocking makes hub report the resulting format
+        self.needs_reply = subcommand in (self.SUBCMD_UNLOCK_MULTI_UPDATE, self.SUBCMD_UNLOCK)
+
+    @classmethod
+    def combination(cls, port, modes_datasets, index=0):
+        """
+        :param modes_datasets: list of (mode, dataset) pairs to be combined, in the order of values in notification
+        """
+        params = bytes([index] + [(mode << 4) | dataset for mode, dataset in modes_datasets])
+        return cls(port, cls.SUBCMD_SET_COMBINATION, params)
 
     def is_reply(self, msg):
         if isinstance(msg, MsgPortInputFmtCombined) and msg.port == self.port:
@@ -504,6 +624,9 @@ class MsgPortInfo(UpstreamMsg):
 
     TYPE = 0x43
 
+    __slots__ = ("port", "info_type", "capabilities", "total_modes", "input_modes", "output_modes",
+                 "possible_mode_combinations")
+
     CAP_OUTPUT = 0b00000001
     CAP_INPUT = 0b00000010
     CAP_COMBINABLE = 0b00000100
@@ -531,7 +654,7 @@ class MsgPortInfo(UpstreamMsg):
             msg.input_modes = msg._bits_list(msg._short())
             msg.output_modes = msg._bits_list(msg._short())
         else:
-            while msg.payload:
+            while msg._remaining():
                 # https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#pos-m
                 val = msg._short()
                 msg.possible_mode_combinations.append(msg._bits_list(val))
@@ -563,6 +686,8 @@ class MsgPortModeInfo(UpstreamMsg):
 
     TYPE = 0x44
 
+    __slots__ = ("port", "mode", "info_type", "value")
+
     MAPPING_FLAGS = {
         7: "Supports NULL value",
         6: "Supports Functional Mapping 2.0+",
@@ -581,6 +706,13 @@ class MsgPortModeInfo(UpstreamMsg):
         0b11: "FLOAT",
     }
 
+    DATASET_SIZES = {
+        "8 bit": 1,
+        "16 bit": 2,
+        "32 bit": 4,
+        "FLOAT": 4,
+    }
+
     def __init__(self):
         super().__init__()
         self.port = None
@@ -633,9 +765,12 @@ class MsgPortValueSingle(UpstreamMsg):
 
     TYPE = 0x45
 
+    __slots__ = ("port", "mode")
+
     def __init__(self):
         super().__init__()
         self.port = None
+        self.mode = None  # not part of message, filled by receiving peripheral
 
     @classmethod
     def decode(cls, data):
@@ -648,19 +783,25 @@ class MsgPortValueSingle(UpstreamMsg):
 class MsgPortValueCombined(UpstreamMsg):
     """
     https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#port-value-combinedmode
+    `pointers` are indexes of combination's (mode, dataset) entries, which values are in payload, in that order
     """
 
     TYPE = 0x46
 
+    __slots__ = ("port", "pointers", "combination")
+
     def __init__(self):
         super().__init__()
         self.port = None
+        self.pointers = []
+        self.combination = None  # not part of message, filled by receiving peripheral
 
     @classmethod
     def decode(cls, data):
         msg = super().decode(data)
         assert isinstance(msg, MsgPortValueCombined)
         msg.port = msg._byte()
+        msg.pointers = msg._bits_list(msg._short())
         return msg
 
 
@@ -671,6 +812,8 @@ class MsgPortInputFmtSingle(UpstreamMsg):
 
     TYPE = 0x47
 
+    __slots__ = ("port", "mode", "upd_delta", "upd_enabled")
+
     def __init__(self, port=None, mode=None, upd_enabled=None, upd_delta=None):
         super().__init__()
         self.port = port
@@ -685,29 +828,37 @@ class MsgPortInputFmtSingle(UpstreamMsg):
         msg.port = msg._byte()
         msg.mode = msg._byte()
         msg.upd_delta = msg._long()
-        if len(msg.payload):
+        if msg._remaining():
             msg.upd_enabled = msg._byte()
 
         return msg
 
 
-class MsgPortInputFmtCombined(UpstreamMsg):  # TODO
+class MsgPortInputFmtCombined(UpstreamMsg):
     """
     https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#port-input-format-combinedmode
     """
 
     TYPE = 0x48
 
+    __slots__ = ("port", "combination_index", "multi_update", "pointers")
+
     def __init__(self):
         super().__init__()
         self.port = None
-        self.combined_control = None
+        self.combination_index = None
+        self.multi_update = None
+        self.pointers = []
 
     @classmethod
     def decode(cls, data):
         msg = super().decode(data)
-        assert isinstance(msg, MsgPortInputFmtSingle)
+        assert isinstance(msg, MsgPortInputFmtCombined)
         msg.port = msg._byte()
+        control = msg._byte()
+        msg.combination_index = control & 0x7F
+        msg.multi_update = bool(control & 0x80)
+        msg.pointers = msg._bits_list(msg._short())
         return msg
 
 
@@ -718,18 +869,19 @@ class MsgVirtualPortSetup(DownstreamMsg):
 
     TYPE = 0x61
 
+    __slots__ = ()
+
     CMD_DISCONNECT = 0x00
     CMD_CONNECT = 0x01
 
     def __init__(self, cmd, port):
         super().__init__()
-        self.payload = pack("<B", cmd)
         if cmd == self.CMD_DISCONNECT:
             assert isinstance(port, int)
-            self.payload += pack("<B", port)
+            self.payload = _TWO_BYTES.pack(cmd, port)
         else:
             assert isinstance(port, (list, tuple))
-            self.payload += pack("<B", port[0]) + pack("<B", port[1])
+            self.payload = _THREE_BYTES.pack(cmd, port[0], port[1])
 
 
 class MsgPortOutput(DownstreamMsg):
@@ -739,6 +891,8 @@ class MsgPortOutput(DownstreamMsg):
 
     TYPE = 0x81
 
+    __slots__ = ("port", "is_buffered", "do_feedback", "wait_complete", "subcommand", "params")
+
     SC_NO_BUFFER = 0b00000001
     SC_FEEDBACK = 0b00010000
 
@@ -763,13 +917,11 @@ class MsgPortOutput(DownstreamMsg):
             startup_completion_flags |= self.SC_FEEDBACK
             self.needs_reply = True
 
-        self.payload = (
-            pack("<B", self.port)
-            + pack("<B", startup_completion_flags)
-            + pack("<B", self.subcommand)
-            + self.params
-        )
-        return super().bytes()
+        # motor commands are sent often, so whole header is packed at once instead of building payload first
+        msglen = len(self.params) + _OUTPUT_HEADER.size
+        assert msglen < 127, "TODO: handle longer messages with 2-byte len"
+        return _OUTPUT_HEADER.pack(msglen, self.hub_id, self.TYPE, self.port, startup_completion_flags,
+                                   self.subcommand) + self.params
 
     def is_reply(self, msg):
         return (
@@ -777,27 +929,55 @@ class MsgPortOutput(DownstreamMsg):
             and msg.port == self.port
             and (not self.wait_complete and msg.is_in_progress() or
                  msg.is_completed() or
+                 msg.is_discarded() or  # command was replaced by another one, it won't complete
                  self.is_buffered)
         )
 
+    def is_ack(self, msg):
+        return isinstance(msg, MsgPortOutputFeedback) and msg.port == self.port
+
 
 class MsgPortOutputFeedback(UpstreamMsg):
+    """
+    https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#port-output-command-feedback
+    Single message may report several ports, `port` and `status` are of the first one, `feedbacks` has all of them
+    """
     TYPE = 0x82
 
+    __slots__ = ("port", "status", "feedbacks")
+
     def __init__(self):
         super().__init__()
         self.port = None
         self.status = None
+        self.feedbacks = []  # (port, status) pairs
 
     @classmethod
     def decode(cls, data):
         msg = super().decode(data)
         assert isinstance(msg, MsgPortOutputFeedback)
-        assert len(msg.payload) == 2, "TODO: implement multi-port feedback message"
-        msg.port = msg._byte()
-        msg.status = msg._byte()
+        assert msg._remaining() >= 2 and not msg._remaining() % 2, "Malformed feedback message"
+        while msg._remaining():
+            msg.feedbacks.append((msg._byte(), msg._byte()))
+        msg.port, msg.status = msg.feedbacks[0]
         return msg
 
+    def split(self):
+        """
+        :return: single-port message for each of reported ports
+        :rtype: list[MsgPortOutputFeedback]
+        """
+        msgs = []
+        for port, status in self.feedbacks:
+            msg = MsgPortOutputFeedback()
+            msg.hub_id = self.hub_id
+            msg.timestamp = self.timestamp
+            msg.port = port
+            msg.status = status
+            msg.feedbacks = [(port, status)]
+            msgs.append(msg)
+        return msgs
+
     def is_in_progress(self):
         return self.status & 0b0001
 
@@ -817,3 +997,5 @@ UPSTREAM_MSGS = (
     MsgPortValueSingle, MsgPortValueCombined, MsgPortInputFmtSingle, MsgPortInputFmtCombined,
     MsgPortOutputFeedback
 )
+
+UPSTREAM_MSGS_BY_TYPE = {msg_kind.TYPE: msg_kind for msg_kind in UPSTREAM_MSGS}
@@ -1,23 +1,37 @@
+import asyncio
 import logging
+import threading
 import time
 import traceback
-from struct import pack, unpack
-from threading import Thread
+from struct import Struct, unpack
 
+from pylgbst.capabilities import PortCapabilities, discover_port
 from pylgbst.messages import (
     MsgHubProperties,
+    MsgPortValueSingle,
+    MsgPortValueCombined,
     MsgPortOutput,
     MsgPortInputFmtSetupSingle,
     MsgPortInfoRequest,
     MsgPortModeInfoRequest,
-    MsgPortInfo,
     MsgPortModeInfo,
     MsgPortInputFmtSingle,
+    MsgPortInputFmtCombined,
+    MsgPortInputFmtSetupCombined,
+    MsgPortOutputFeedback,
 )
-from pylgbst.utilities import queue, str2hex, usbyte, ushort, usint, abs_scaled_100
+from pylgbst.utilities import LoopCallback, PortDataBuffer, Subscriber, queue, str2hex, usbyte, ushort, usint, \
+    abs_scaled_100
 
 log = logging.getLogger("peripherals")
 
+# precompiled payload layouts for direct mode writes
+_BYTE = Struct("<B")
+_SBYTE = Struct("<b")
+_MODE_BYTE = Struct("<BB")
+_MODE_SHORT = Struct("<BH")
+_MODE_RGB = Struct("<BBBB")
+
 # COLORS
 COLOR_BLACK = 0x00
 COLOR_PINK = 0x01
@@ -51,11 +65,93 @@ COLORS = {
 # https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#io-type-id
 
 
+class ModePoller:
+    """
+    Time-slices peripheral's port between several modes, each of them gets value updates enabled for `interval`.
+    Values that arrive are kept by peripheral, so reading any of these modes needs no mode switch round trip.
+    """
+
+    def __init__(self, peripheral, modes, interval=0.1, granularity=1, combined=False):
+        """
+        :type peripheral: Peripheral
+        :param combined: use combined mode to get values of all modes at once, instead of time slicing
+        """
+        assert modes, "No modes to poll"
+        self.peripheral = peripheral
+        self.modes = tuple(modes)
+        self.interval = interval
+        self.granularity = granularity
+        self.combined = combined
+        self.started = None
+        self._stopped = threading.Event()
+        self._switch_off = True
+        self._thread = None
+
+    def start(self):
+        self.started = time.monotonic_ns()
+        if self.combined:
+            self.peripheral._set_combined_mode(self.modes, self.granularity)
+            return
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.name = "Mode poller: %s" % self.peripheral
+        self._thread.start()
+
+    def stop(self, timeout=None, switch_off=True):
+        """
+        :param timeout: seconds to wait for polling thread to finish, by default enough for its pending mode switch
+        :param switch_off: whether to switch off port value updates, not possible once device is detached
+        """
+        self._switch_off = switch_off
+        self._stopped.set()
+        if self.combined:
+            if switch_off:
+                self.peripheral.set_port_mode(self.peripheral._port_mode.mode, False)
+        elif self._thread is not threading.current_thread():
+            if timeout is None:
+                timeout = self._request_timeout()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                log.warning("Polling of %s has not finished within %ss", self.peripheral, timeout)
+
+    def _request_timeout(self):
+        return self.interval + (self.peripheral.hub.timeout or 1.0)
+
+    def _switch(self, mode, send_updates):
+        """
+        Switches port mode waiting for reply no longer than the request timeout, so thread can't get stuck
+        """
+        msg = self.peripheral._port_mode_msg(mode, send_updates, self.granularity)
+        if msg:
+            self.peripheral._set_port_mode_reply(self.peripheral.hub.send(msg, self._request_timeout()))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            for mode in self.modes:
+                try:
+                    self._switch(mode, True)
+                except BaseException:
+                    log.warning("Failed to switch %s into mode %s: %s", self.peripheral, mode, traceback.format_exc())
+
+                if self._stopped.wait(self.interval):
+                    break
+
+        if not self._switch_off:
+            return
+
+        try:
+            self._switch(self.peripheral._port_mode.mode, False)
+        except BaseException:
+            log.warning("Failed to switch off updates of %s: %s", self.peripheral, traceback.format_exc())
+
+
 class Peripheral:
     """
     :type parent: pylgbst.hub.Hub
-    :type _incoming_port_data: queue.Queue
+    :type _incoming_port_data: PortDataBuffer
     :type _port_mode: MsgPortInputFmtSingle
+    :type history: pylgbst.history.SensorHistory
     """
 
     def __init__(self, parent, port):
@@ -66,17 +162,32 @@ class Peripheral:
         self.virtual_ports = ()
         self.hub = parent
         self.port = port
+        self.dev_type = None  # filled by hub on attach, along with revisions that are "x.x.xx.xxxx" strings
+        self.hw_revision = None
+        self.sw_revision = None
 
         self.is_buffered = False
 
         self._subscribers = set()
         self._port_mode = MsgPortInputFmtSingle(self.port, None, False, 1)
+        self._port_mode_timestamp = 0
 
-        self._incoming_port_data = queue.Queue(1)  # limit 1 means we drop data if we can't handle it fast enough
-        thr = Thread(target=self._queue_reader)
-        thr.daemon = True
-        thr.name = "Port data queue: %s" % self
-        thr.start()
+        self.max_value_age = None  # seconds, sensor values that are not older are returned without request
+        self._last_values = {}  # mode => (timestamp, decoded value)
+        self._last_values_cond = threading.Condition()
+        self._poller = None
+
+        self._value_formats = {}  # mode => (number of datasets, dataset size)
+        self._combination = None  # (mode, dataset, size) entries of active combined mode
+        self._combination_timestamp = 0
+        self._pending_combination = None
+        self._combined_raw = []  # last raw bytes of each combination entry
+
+        self._incoming_port_data = PortDataBuffer()  # keeps only latest value if we can't handle them fast enough
+
+        self.history = None  # enabled by `enable_history`
+        self._hub_handlers = []  # (message class, port or None, callback) registered in hub
+        self._attach()
 
     def __repr__(self):
         msg = "%s on port 0x%x" % (self.__class__.__name__, self.port)
@@ -84,8 +195,48 @@ class Peripheral:
             msg += " (ports 0x%x and 0x%x combined)" % (self.virtual_ports[0], self.virtual_ports[1])
         return msg
 
+    def _attach(self):
+        """
+        Registers handlers of hub notifications, they are unregistered by `detach`
+        """
+        self._add_port_handler(MsgPortValueSingle, self.queue_port_data)
+        self._add_port_handler(MsgPortValueCombined, self.queue_port_data)
+        self._add_port_handler(MsgPortInputFmtSingle, self._handle_port_mode)
+        self._add_port_handler(MsgPortInputFmtCombined, self._handle_combined_mode)
+
+    def detach(self):
+        """
+        Stops receiving hub notifications, it's called when device gets detached from hub
+        """
+        # it's called from notification thread, so replies to poller's requests can't arrive while waiting for it
+        self.stop_polling(0, switch_off=False)
+        for msg_class, port, callback in self._hub_handlers:
+            if port is None:
+                self.hub.remove_message_handler(msg_class, callback)
+            else:
+                self.hub.remove_port_handler(msg_class, port, callback)
+        self._hub_handlers = []
+
+    def _add_port_handler(self, msg_class, callback):
+        self.hub.add_port_handler(msg_class, self.port, callback)
+        self._hub_handlers.append((msg_class, self.port, callback))
+
+    def _add_message_handler(self, msg_class, callback):
+        self.hub.add_message_handler(msg_class, callback)
+        self._hub_handlers.append((msg_class, None, callback))
+
     def set_port_mode(self, mode, send_updates=None, update_delta=None):
-        assert not self.virtual_ports, "TODO: support combined mode for sensors"
+        msg = self._port_mode_msg(mode, send_updates, update_delta)
+        if msg:
+            self._set_port_mode_reply(self.hub.send(msg))
+
+    async def set_port_mode_async(self, mode, send_updates=None, update_delta=None):
+        msg = self._port_mode_msg(mode, send_updates, update_delta)
+        if msg:
+            self._set_port_mode_reply(await self.hub.send_async(msg))
+
+    def _port_mode_msg(self, mode, send_updates, update_delta):
+        assert not self.virtual_ports, "Sensors of virtual port are not supported, use its ports"
 
         if send_updates is None:
             send_updates = self._port_mode.upd_enabled
@@ -101,53 +252,289 @@ class Peripheral:
                 and self._port_mode.upd_delta == update_delta
         ):
             log.debug("Already in target mode, no need to switch")
-            return
+            return None
         else:
-            msg = MsgPortInputFmtSetupSingle(self.port, mode, update_delta, send_updates)
-            resp = self.hub.send(msg)
-            assert isinstance(resp, MsgPortInputFmtSingle)
-            self._port_mode = resp
+            return MsgPortInputFmtSetupSingle(self.port, mode, update_delta, send_updates)
+
+    def _set_port_mode_reply(self, resp):
+        assert isinstance(resp, MsgPortInputFmtSingle)
+        self._handle_port_mode(resp)
+
+    def _handle_port_mode(self, msg):
+        """
+        Mode is updated from notification thread, so that port values that follow are decoded in the right mode
+        """
+        self._port_mode = msg
+        self._port_mode_timestamp = msg.timestamp or 0
+        self._combination = None  # single mode setup ends combined mode
+
+    def _handle_combined_mode(self, msg):
+        """
+        :type msg: MsgPortInputFmtCombined
+        """
+        if self._pending_combination is not None:
+            self._combination = self._pending_combination
+            self._combination_timestamp = msg.timestamp or 0
+            self._combined_raw = [None] * len(self._combination)
+            self._pending_combination = None
+
+    def _value_format(self, mode):
+        """
+        :return: number of datasets of the mode's value and size of each one in bytes
+        """
+        if mode not in self._value_formats:
+            resp = self.hub.send(MsgPortModeInfoRequest(self.port, mode, MsgPortModeInfoRequest.INFO_VALUE_FORMAT))
+            assert isinstance(resp, MsgPortModeInfo)
+            self._value_formats[mode] = (resp.value["datasets"], MsgPortModeInfo.DATASET_SIZES[resp.value["type"]])
+        return self._value_formats[mode]
+
+    def _set_combined_mode(self, modes, granularity=1):
+        """
+        Makes hub send values of all `modes` together, with updates enabled
+        """
+        entries = []
+        for mode in modes:
+            datasets, size = self._value_format(mode)
+            entries.extend((mode, dataset, size) for dataset in range(datasets))
+        assert len(entries) <= 16, "Too many datasets to combine: %s" % len(entries)
+
+        self.hub.send(MsgPortInputFmtSetupCombined(self.port, MsgPortInputFmtSetupCombined.SUBCMD_LOCK))
+        for mode in modes:
+            setup = MsgPortInputFmtSetupSingle(self.port, mode, granularity, 1)
+            setup.needs_reply = False  # device is locked, its format is reported after unlock
+            self.hub.send(setup)
+        self.hub.send(MsgPortInputFmtSetupCombined.combination(self.port, [(x[0], x[1]) for x in entries]))
+
+        self._pending_combination = tuple(entries)
+        unlock = MsgPortInputFmtSetupCombined(self.port, MsgPortInputFmtSetupCombined.SUBCMD_UNLOCK_MULTI_UPDATE)
+        self.hub.send(unlock)
+        self._port_mode = MsgPortInputFmtSingle(self.port, modes[-1], True, granularity)
+
+    def _can_combine(self, modes):
+        """
+        :return: True if port reports combination that includes all of `modes`
+        """
+        try:
+            caps = self.describe_possible_modes()
+        except RuntimeError:
+            log.debug("Failed to get mode combinations of %s: %s", self, traceback.format_exc())
+            return False
+        return caps.combinable and any(set(modes) <= set(x) for x in caps.mode_combinations)
+
+    def _mode_of(self, msg):
+        """
+        :return: mode the port was in when value was received
+        """
+        mode = getattr(msg, "mode", None)
+        return self._port_mode.mode if mode is None else mode
 
     def _send_output(self, msg):
         assert isinstance(msg, MsgPortOutput)
         msg.is_buffered = self.is_buffered  # TODO: support buffering
         self.hub.send(msg)
 
-    def get_sensor_data(self, mode):
+    def _send_output_request(self, msg):
+        """
+        :rtype: concurrent.futures.Future
+        """
+        assert isinstance(msg, MsgPortOutput)
+        msg.is_buffered = self.is_buffered
+        return self.hub.send_request(msg)
+
+    async def _send_output_async(self, msg):
+        assert isinstance(msg, MsgPortOutput)
+        msg.is_buffered = self.is_buffered
+        await self.hub.send_async(msg)
+
+    def get_sensor_data(self, mode, max_age=None):
+        """
+        Value is not requested from hub if subscription in the same mode keeps it up to date,
+        or if it is not older than `max_age` seconds (`max_value_age` field is used if None)
+        """
+        cached = self._get_cached_data(mode, max_age)
+        if cached is not None:
+            return cached
+
+        poller = self._poller
+        if poller is not None and mode in poller.modes:
+            return self._wait_polled_data(mode, poller)
+
         self.set_port_mode(mode)
         msg = MsgPortInfoRequest(self.port, MsgPortInfoRequest.INFO_PORT_VALUE)
         resp = self.hub.send(msg)
-        return self._decode_port_data(resp)
+        return self._cache_data(mode, resp)
+
+    async def get_sensor_data_async(self, mode, max_age=None):
+        cached = self._get_cached_data(mode, max_age)
+        if cached is not None:
+            return cached
+
+        poller = self._poller
+        if poller is not None and mode in poller.modes:
+            return await asyncio.get_running_loop().run_in_executor(None, self._wait_polled_data, mode, poller)
+
+        await self.set_port_mode_async(mode)
+        msg = MsgPortInfoRequest(self.port, MsgPortInfoRequest.INFO_PORT_VALUE)
+        resp = await self.hub.send_async(msg)
+        return self._cache_data(mode, resp)
+
+    def _get_cached_data(self, mode, max_age):
+        cached = self._last_values.get(mode)
+        if cached is None:
+            return None
+
+        poller = self._poller
+        if poller is not None and mode in poller.modes and cached[0] >= poller.started:
+            return cached[1]  # it's refreshed once per polling cycle
+
+        timestamp, decoded = cached
+        if self._port_mode.mode == mode and self._port_mode.upd_enabled and timestamp >= self._port_mode_timestamp:
+            return decoded  # hub notifies us on any change
+
+        combination = self._combination
+        if combination and timestamp >= self._combination_timestamp and any(x[0] == mode for x in combination):
+            return decoded
+
+        if max_age is None:
+            max_age = self.max_value_age
+        if max_age is not None and time.monotonic_ns() - timestamp <= max_age * 1000000000:
+            return decoded
+        return None
+
+    def _cache_data(self, mode, msg):
+        decoded = self._decode_port_data(msg)
+        if msg.timestamp is not None:
+            self._last_values[mode] = (msg.timestamp, decoded)
+        return decoded
+
+    def _wait_polled_data(self, mode, poller):
+        timeout = poller.interval * len(poller.modes) + (self.hub.timeout or 1.0)
+        with self._last_values_cond:
+            if not self._last_values_cond.wait_for(lambda: self._get_cached_data(mode, 0) is not None, timeout):
+                raise TimeoutError("No value for mode %s of %s within %ss" % (mode, self, timeout))
+        return self._last_values[mode][1]
+
+    def start_polling(self, modes, interval=0.1, granularity=1):
+        """
+        Switches port between `modes` in background, keeping each mode for `interval` seconds with updates enabled.
+        `get_sensor_data` for these modes returns values received meanwhile, without switching port mode.
+        """
+        if self._subscribers:
+            raise ValueError("Port has subscribers, unsubscribe all of them first")
+        self.stop_polling()
+        combined = len(modes) > 1 and self._can_combine(modes)
+        self._poller = ModePoller(self, modes, interval, granularity, combined)
+        self._poller.start()
+
+    def stop_polling(self, timeout=None, switch_off=True):
+        """
+        :param timeout: seconds to wait for polling thread to finish, see `ModePoller.stop`
+        :param switch_off: whether to switch off port value updates
+        """
+        poller = self._poller
+        self._poller = None
+        if poller is not None:
+            poller.stop(timeout, switch_off)
+
+    def subscribe(self, callback, mode=0x00, granularity=1, timestamps=False):
+        """
+        :param timestamps: if True, callback gets `time.monotonic_ns()` of notification receipt before values
+        """
+        self._check_can_subscribe(mode)
+        self.set_port_mode(mode, True, granularity)
+        if callback:
+            self._subscribers.add(Subscriber(callback, timestamps))
+
+    async def subscribe_async(self, callback, mode=0x00, granularity=1, timestamps=False):
+        """
+        Awaitable version of `subscribe`, callback is called inside the event loop of subscriber.
+        Callback can be a coroutine function as well.
+        """
+        self._check_can_subscribe(mode)
+        await self.set_port_mode_async(mode, True, granularity)
+        if callback:
+            self._subscribers.add(LoopCallback(asyncio.get_running_loop(), callback, timestamps))
+
+    def subscribe_combined(self, callback, modes, granularity=1, timestamps=False):
+        """
+        Subscribes to values of several modes at once, they have to be in one of port's mode combinations.
+        Callback gets dict of mode => decoded values, for modes that were updated.
+        """
+        if self._poller is not None:
+            raise ValueError("Port modes are polled, call stop_polling first")
+
+        if self._subscribers and not self._is_combined(modes):
+            raise ValueError("Port is in active mode %r, unsubscribe all subscribers first" % self._port_mode)
+
+        if not self._is_combined(modes):
+            self._set_combined_mode(modes, granularity)
+
+        if callback:
+            self._subscribers.add(Subscriber(callback, timestamps))
+
+    def _is_combined(self, modes):
+        combination = self._combination or self._pending_combination
+        return combination is not None and list(dict.fromkeys(x[0] for x in combination)) == list(modes)
 
-    def subscribe(self, callback, mode=0x00, granularity=1):
-        if self._port_mode.mode != mode and self._subscribers:
+    def _check_can_subscribe(self, mode):
+        if self._poller is not None:
+            raise ValueError("Port modes are polled, call stop_polling first")
+
+        combined = self._combination is not None or self._pending_combination is not None
+        if (self._port_mode.mode != mode or combined) and self._subscribers:
             raise ValueError(
                 "Port is in active mode %r, unsubscribe all subscribers first"
                 % self._port_mode
             )
-        self.set_port_mode(mode, True, granularity)
-        if callback:
-            self._subscribers.add(callback)
 
     def unsubscribe(self, callback=None):
+        if self._remove_subscriber(callback):
+            self.set_port_mode(self._port_mode.mode, False)
+
+    async def unsubscribe_async(self, callback=None):
+        if self._remove_subscriber(callback):
+            await self.set_port_mode_async(self._port_mode.mode, False)
+
+    def _remove_subscriber(self, callback):
+        """
+        :return: True if port value updates have to be switched off
+        """
         if callback in self._subscribers:
             self._subscribers.remove(callback)
 
         if not self._port_mode.upd_enabled:
             log.warning("Attempt to unsubscribe while port value updates are off: %s", self)
-        elif not self._subscribers:
-            self.set_port_mode(self._port_mode.mode, False)
+            return False
+        return not self._subscribers
 
-    def _notify_subscribers(self, *args, **kwargs):
+    def _notify_subscribers(self, *args, timestamp=None):
         for subscriber in self._subscribers.copy():
-            subscriber(*args, **kwargs)
+            subscriber.notify(args, timestamp)
         return args
 
+    @property
+    def port_data_buffer(self):
+        """
+        Buffer of not yet handled port data, it has drop and depth counters
+        :rtype: PortDataBuffer
+        """
+        return self._incoming_port_data
+
+    def set_buffer_policy(self, policy, maxsize=1, timeout=None):
+        """
+        Selects what happens to port data when subscribers can't handle it fast enough, see `PortDataBuffer`.
+        `PortDataBuffer.BLOCK` policy stalls all notifications of the hub while buffer is full.
+        """
+        self._incoming_port_data = PortDataBuffer(policy, maxsize, timeout)
+
     def queue_port_data(self, msg):
-        try:
-            self._incoming_port_data.put_nowait(msg)
-        except queue.Full:
-            log.debug("Dropped port data: %r", msg)
+        if isinstance(msg, MsgPortValueSingle):
+            msg.mode = self._port_mode.mode
+        else:
+            msg.combination = self._combination
+        if not self._incoming_port_data.put(msg):
+            log.debug("Dropped port data of %s", self)
+        self.hub.dispatcher.schedule(self._process_port_data)
 
     def _decode_port_data(self, msg):
         """Return the sensor value according to the current sensor mode
@@ -160,66 +547,118 @@ class Peripheral:
         """
         :type msg: pylgbst.messages.MsgPortValueSingle
         """
+        if isinstance(msg, MsgPortValueCombined):
+            self._handle_combined_data(msg)
+            return
+
         decoded = self._decode_port_data(msg)
         assert isinstance(decoded, (tuple, list)), "Unexpected data type: %s" % type(decoded)
-        self._notify_subscribers(*decoded)
+        mode = self._mode_of(msg)
+        if mode is not None:
+            self._last_values[mode] = (msg.timestamp, decoded)
+            if self._poller is not None:
+                with self._last_values_cond:
+                    self._last_values_cond.notify_all()
+        if self.history is not None:
+            self.history.append(msg.timestamp, decoded)
+        self._notify_subscribers(*decoded, timestamp=msg.timestamp)
+
+    def _handle_combined_data(self, msg):
+        """
+        Splits values of combined mode by their modes, and decodes each of them as value of single mode
+        :type msg: MsgPortValueCombined
+        """
+        combination = msg.combination
+        if combination is None:
+            log.warning("Got combined mode data while not in combined mode: %r", msg)
+            return
+
+        if len(self._combined_raw) != len(combination):
+            self._combined_raw = [None] * len(combination)
 
-    def _queue_reader(self):
+        data = msg.payload
+        offset = 0
+        for pointer in msg.pointers:
+            size = combination[pointer][2]
+            self._combined_raw[pointer] = data[offset:offset + size]
+            offset += size
+
+        updated = {}
+        for mode in dict.fromkeys(combination[x][0] for x in msg.pointers):
+            parts = [self._combined_raw[idx] for idx, entry in enumerate(combination) if entry[0] == mode]
+            if None in parts:
+                continue  # no values of some dataset yet
+
+            single = MsgPortValueSingle()
+            single.port = msg.port
+            single.mode = mode
+            single.timestamp = msg.timestamp
+            single.payload = b"".join(parts)
+            updated[mode] = self._decode_port_data(single)
+            self._last_values[mode] = (msg.timestamp, updated[mode])
+
+        if self.history is not None and None not in self._combined_raw:
+            # one sample per notification, with latest values of all combined modes in their combination order
+            modes = dict.fromkeys(entry[0] for entry in combination)
+            self.history.append(msg.timestamp, tuple(val for mode in modes for val in self._last_values[mode][1]))
+        if self._poller is not None:
+            with self._last_values_cond:
+                self._last_values_cond.notify_all()
+        if updated:
+            self._notify_subscribers(updated, timestamp=msg.timestamp)
+
+    def enable_history(self, capacity=1000):
+        """
+        Starts keeping last `capacity` values from subscription in `history` field, requires `numpy`
+        :rtype: pylgbst.history.SensorHistory
+        """
+        from pylgbst.history import SensorHistory
+
+        self.history = SensorHistory(capacity)
+        return self.history
+
+    def disable_history(self):
+        self.history = None
+
+    def _process_port_data(self):
+        """
+        Handles all queued port data, hub's dispatcher runs it for one peripheral at a time
+        """
         while True:
-            msg = self._incoming_port_data.get()
+            try:
+                msg = self._incoming_port_data.get_nowait()
+            except queue.Empty:
+                return
+
             try:
                 self._handle_port_data(msg)
             except BaseException:
                 log.warning("%s", traceback.format_exc())
                 log.warning("Failed to handle port data by %s: %r", self, msg)
 
-    def describe_possible_modes(self):
-        mode_info = self.hub.send(MsgPortInfoRequest(self.port, MsgPortInfoRequest.INFO_MODE_INFO))
-        assert isinstance(mode_info, MsgPortInfo)
-        info = {
-            "mode_count": mode_info.total_modes,
-            "input_modes": [],
-            "output_modes": [],
-            "capabilities": {
-                "logically_combinable": mode_info.is_combinable(),
-                "synchronizable": mode_info.is_synchronizable(),
-                "can_output": mode_info.is_output(),
-                "can_input": mode_info.is_input(),
-            },
-        }
-
-        if mode_info.is_combinable():
-            mode_combinations = self.hub.send(
-                MsgPortInfoRequest(self.port, MsgPortInfoRequest.INFO_MODE_COMBINATIONS)
-            )
-            assert isinstance(mode_combinations, MsgPortInfo)
-            info['possible_mode_combinations'] = mode_combinations.possible_mode_combinations
-
-        info["modes"] = []
-        for mode in range(256):
-            info["modes"].append(self._describe_mode(mode))
-
-        for mode in mode_info.output_modes:
-            info["output_modes"].append(self._describe_mode(mode))
-
-        for mode in mode_info.input_modes:
-            info["input_modes"].append(self._describe_mode(mode))
-
-        log.debug("Port info for 0x%x: %s", self.port, info)
-        return info
+    def describe_possible_modes(self, window=8):
+        """
+        Describes port and its modes, see `pylgbst.capabilities.discover_port` for `window`.
+        Description is taken from hub's `capability_cache` if it has one for this device.
 
-    def _describe_mode(self, mode):
-        descr = {"Mode": mode}
-        for info in MsgPortModeInfoRequest.INFO_TYPES:
-            try:
-                resp = self.hub.send(MsgPortModeInfoRequest(self.port, mode, info))
-                assert isinstance(resp, MsgPortModeInfo)
-                descr[MsgPortModeInfoRequest.INFO_TYPES[info]] = resp.value
-            except RuntimeError:
-                log.debug("Got error while requesting info 0x%x: %s", info, traceback.format_exc())
-                if info == MsgPortModeInfoRequest.INFO_NAME:
-                    break
-        return descr
+        :rtype: pylgbst.capabilities.PortCapabilities
+        """
+        cache = self.hub.capability_cache
+        cacheable = cache is not None and None not in (self.dev_type, self.hw_revision, self.sw_revision)
+        if cacheable:
+            data = cache.load(self.dev_type, self.hw_revision, self.sw_revision)
+            if data is not None:
+                try:
+                    caps = PortCapabilities.from_dict(data)
+                    caps.port = self.port  # same device may be attached to other port
+                    return caps
+                except (KeyError, TypeError, ValueError):
+                    log.debug("Cached description of %s is outdated: %s", self, traceback.format_exc())
+
+        caps = discover_port(self.hub, self.port, window)
+        if cacheable:
+            cache.save(self.dev_type, self.hw_revision, self.sw_revision, caps.to_dict())
+        return caps
 
 
 class LEDRGB(Peripheral):
@@ -244,12 +683,7 @@ class LEDRGB(Peripheral):
         if isinstance(color, (list, tuple)):
             assert len(color) == 3, "RGB color has to have 3 values"
             self.set_port_mode(self.MODE_RGB)
-            payload = (
-                    pack("<B", self.MODE_RGB)
-                    + pack("<B", color[0])
-                    + pack("<B", color[1])
-                    + pack("<B", color[2])
-            )
+            payload = _MODE_RGB.pack(self.MODE_RGB, color[0], color[1], color[2])
         else:
             if color == COLOR_NONE:
                 color = COLOR_BLACK
@@ -258,7 +692,7 @@ class LEDRGB(Peripheral):
                 raise ValueError("Color %s is not in list of available colors" % color)
 
             self.set_port_mode(self.MODE_INDEX)
-            payload = pack("<B", self.MODE_INDEX) + pack("<B", color)
+            payload = _MODE_BYTE.pack(self.MODE_INDEX, color)
 
         msg = MsgPortOutput(self.port, MsgPortOutput.WRITE_DIRECT_MODE_DATA, payload)
         self._send_output(msg)
@@ -310,7 +744,7 @@ class LEDLight(Peripheral):
             raise ValueError("Brightness must be a number between 0 and 100")
 
         self.set_port_mode(self.MODE_BRIGHTNESS)
-        payload = pack("<B", self.MODE_BRIGHTNESS) + pack("<B", int(brightness))
+        payload = _MODE_BYTE.pack(self.MODE_BRIGHTNESS, int(brightness))
 
         msg = MsgPortOutput(self.port, MsgPortOutput.WRITE_DIRECT_MODE_DATA, payload)
         self._send_output(msg)
@@ -335,7 +769,7 @@ class LEDLight(Peripheral):
 
 class BaseMotor(Peripheral):
     def _write_direct_mode(self, subcmd, params):
-        params = pack("<B", subcmd) + params
+        params = _BYTE.pack(subcmd) + params
         msg = MsgPortOutput(self.port, MsgPortOutput.WRITE_DIRECT_MODE_DATA, params)
         self._send_output(msg)
 
@@ -352,7 +786,7 @@ class TrainMotor(BaseMotor):
         """
         Power the motor, with value -1.0..1.0
         """
-        params = pack("<b", abs_scaled_100(param))
+        params = _SBYTE.pack(abs_scaled_100(param))
         self._write_direct_mode(self.SUBCMD_POWER, params)
 
     def stop(self):
@@ -373,9 +807,32 @@ class Motor(BaseMotor):
     END_STATE_HOLD = 126
     END_STATE_FLOAT = 0
 
+    # precompiled parameter layouts, for single and for grouped (virtual port) motors
+    _POWER = Struct("<b")
+    _POWER_GROUPED = Struct("<bb")
+    _PROFILE = Struct("<HB")
+    _SPEED = Struct("<bBB")
+    _SPEED_GROUPED = Struct("<bbBB")
+    _TIMED = Struct("<HbBBB")
+    _TIMED_GROUPED = Struct("<HbbBBB")
+
     def __init__(self, parent, port):
-        super().__init__(parent, port)
         self.cmd_in_progress = False
+        self._completion = threading.Condition()
+        super().__init__(parent, port)  # attaches feedback handler
+
+    def _attach(self):
+        super()._attach()
+        self._add_port_handler(MsgPortOutputFeedback, self._handle_feedback)
+
+    def _handle_feedback(self, msg):
+        """
+        :type msg: MsgPortOutputFeedback
+        """
+        with self._completion:
+            self.cmd_in_progress = bool(msg.is_in_progress())
+            self._completion.notify_all()
+        log.debug("Command on device %s %s", self, "in progress" if self.cmd_in_progress else "completed")
 
     def _speed_abs(self, relative):  # FIXME: it's not "speed", rather it's a "power"
         if relative == Motor.END_STATE_BRAKE or relative == Motor.END_STATE_HOLD:
@@ -385,95 +842,135 @@ class Motor(BaseMotor):
 
         return abs_scaled_100(relative)
 
-    def _send_cmd(self, subcmd, params, wait_complete=True):
+    def _cmd_msg(self, subcmd, params, wait_complete=True):
         if self.virtual_ports:
             subcmd += 1  # de-facto rule
 
-        msg = MsgPortOutput(self.port, subcmd, params, wait_complete)
-        self._send_output(msg)
+        return MsgPortOutput(self.port, subcmd, params, wait_complete)
+
+    def _send_cmd(self, subcmd, params, wait_complete=True):
+        self._send_output(self._cmd_msg(subcmd, params, wait_complete))
+
+    def _send_completable(self, msg, wait_complete):
+        """
+        :param msg: command that is replied with its completion
+        :return: None if completion was waited for, future of completion feedback otherwise
+        :rtype: concurrent.futures.Future
+        """
+        if wait_complete:
+            self._send_output(msg)
+            return None
+
+        with self._completion:
+            self.cmd_in_progress = True  # until hub reports otherwise, so `wait_complete()` can't miss the command
+        return self._send_output_request(msg)
 
     def start_power(self, power_primary=1.0, power_secondary=None):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-startpower-power
         """
+        self._send_output(self._start_power_msg(power_primary, power_secondary))
+
+    async def start_power_async(self, *args, **kwargs):
+        """Awaitable version of `start_power`"""
+        await self._send_output_async(self._start_power_msg(*args, **kwargs))
+
+    def _start_power_msg(self, power_primary=1.0, power_secondary=None):
         if power_secondary is None:
             power_secondary = power_primary
 
         if self.virtual_ports:
-            cmd = self.SUBCMD_START_POWER_GROUPED - 1  # because _send_cmd will do +1
+            cmd = self.SUBCMD_START_POWER_GROUPED - 1  # because _cmd_msg will do +1
         else:
             cmd = self.SUBCMD_START_POWER
 
-        params = b""
-        params += pack("<b", self._speed_abs(power_primary))
         if self.virtual_ports:
-            params += pack("<b", self._speed_abs(power_secondary))
+            params = self._POWER_GROUPED.pack(self._speed_abs(power_primary), self._speed_abs(power_secondary))
+        else:
+            params = self._POWER.pack(self._speed_abs(power_primary))
 
-        self._send_cmd(cmd, params)
+        return self._cmd_msg(cmd, params)
 
     def stop(self):
         self.timed(0)
 
+    async def stop_async(self):
+        await self.timed_async(0)
+
     def set_acc_profile(self, seconds, profile_no=0x00):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-setacctime-time-profileno-0x05
         """
-        params = b""
-        params += pack("<H", int(seconds * 1000))
-        params += pack("<B", profile_no)
-
+        params = self._PROFILE.pack(int(seconds * 1000), profile_no)
         self._send_cmd(self.SUBCMD_SET_ACC_TIME, params)
 
     def set_dec_profile(self, seconds, profile_no=0x00):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-setdectime-time-profileno-0x06
         """
-        params = b""
-        params += pack("<H", int(seconds * 1000))
-        params += pack("<B", profile_no)
-
+        params = self._PROFILE.pack(int(seconds * 1000), profile_no)
         self._send_cmd(self.SUBCMD_SET_DEC_TIME, params)
 
     def start_speed(self, speed_primary=1.0, speed_secondary=None, max_power=1.0, use_profile=0b11):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-startspeed-speed-maxpower-useprofile-0x07
         """
+        self._send_output(self._start_speed_msg(speed_primary, speed_secondary, max_power, use_profile))
+
+    async def start_speed_async(self, *args, **kwargs):
+        """Awaitable version of `start_speed`"""
+        await self._send_output_async(self._start_speed_msg(*args, **kwargs))
+
+    def _start_speed_msg(self, speed_primary=1.0, speed_secondary=None, max_power=1.0, use_profile=0b11):
         if speed_secondary is None:
             speed_secondary = speed_primary
 
-        params = b""
-        params += pack("<b", self._speed_abs(speed_primary))
         if self.virtual_ports:
-            params += pack("<b", self._speed_abs(speed_secondary))
-
-        params += pack("<B", int(100 * max_power))
-        params += pack("<B", use_profile)
+            params = self._SPEED_GROUPED.pack(self._speed_abs(speed_primary), self._speed_abs(speed_secondary),
+                                              int(100 * max_power), use_profile)
+        else:
+            params = self._SPEED.pack(self._speed_abs(speed_primary), int(100 * max_power), use_profile)
 
-        self._send_cmd(self.SUBCMD_START_SPEED, params)
+        return self._cmd_msg(self.SUBCMD_START_SPEED, params)
 
     def timed(self, seconds, speed_primary=1.0, speed_secondary=None, max_power=1.0, end_state=END_STATE_BRAKE,
               use_profile=0b11, wait_complete=True):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-startspeedfortime-time-speed-maxpower-endstate-useprofile-0x09
+
+        :return: future of command completion if `wait_complete` is False
         """
+        msg = self._timed_msg(seconds, speed_primary, speed_secondary, max_power, end_state, use_profile)
+        return self._send_completable(msg, wait_complete)
+
+    async def timed_async(self, *args, **kwargs):
+        """Awaitable version of `timed`"""
+        await self._send_output_async(self._timed_msg(*args, **kwargs))
+
+    def _timed_msg(self, seconds, speed_primary=1.0, speed_secondary=None, max_power=1.0, end_state=END_STATE_BRAKE,
+                   use_profile=0b11, wait_complete=True):
         if speed_secondary is None:
             speed_secondary = speed_primary
 
-        params = b""
-        params += pack("<H", int(seconds * 1000))
-        params += pack("<b", self._speed_abs(speed_primary))
         if self.virtual_ports:
-            params += pack("<b", self._speed_abs(speed_secondary))
+            params = self._TIMED_GROUPED.pack(int(seconds * 1000), self._speed_abs(speed_primary),
+                                              self._speed_abs(speed_secondary), int(100 * max_power), end_state,
+                                              use_profile)
+        else:
+            params = self._TIMED.pack(int(seconds * 1000), self._speed_abs(speed_primary), int(100 * max_power),
+                                      end_state, use_profile)
 
-        params += pack("<B", int(100 * max_power))
-        params += pack("<B", end_state)
-        params += pack("<B", use_profile)
+        return self._cmd_msg(self.SUBCMD_START_SPEED_FOR_TIME, params, wait_complete)
 
-        self._send_cmd(self.SUBCMD_START_SPEED_FOR_TIME, params, wait_complete)
+    def wait_complete(self, timeout=None):
+        """
+        Waits until the latest command sent to the motor is complete
 
-    def wait_complete(self):
-        while self.cmd_in_progress:
-            time.sleep(0.01)
+        :raises TimeoutError: if command is not complete in `timeout` seconds
+        """
+        with self._completion:
+            if not self._completion.wait_for(lambda: not self.cmd_in_progress, timeout):
+                raise TimeoutError("Command on %s is not complete within %ss" % (self, timeout))
 
 
 class EncodedMotor(Motor):
@@ -488,13 +985,30 @@ class EncodedMotor(Motor):
     SENSOR_ANGLE = 0x02
     SENSOR_TEST = 0x03  # exists, but neither input nor output mode
 
+    _ANGLED = Struct("<IbBBB")
+    _ANGLED_GROUPED = Struct("<IbbBBB")
+    _POSITION = Struct("<ibBBB")
+    _POSITION_GROUPED = Struct("<iibBBB")
+    _ENCODER = Struct("<i")
+    _ENCODER_GROUPED = Struct("<ii")
+
     def angled(self, degrees, speed_primary=1.0, speed_secondary=None, max_power=1.0, end_state=Motor.END_STATE_BRAKE,
                use_profile=0b11, wait_complete=True):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-startspeedfordegrees-degrees-speed-maxpower-endstate-useprofile-0x0b
         :type degrees: int
         :type speed_primary: float
+        :return: future of command completion if `wait_complete` is False
         """
+        msg = self._angled_msg(degrees, speed_primary, speed_secondary, max_power, end_state, use_profile)
+        return self._send_completable(msg, wait_complete)
+
+    async def angled_async(self, *args, **kwargs):
+        """Awaitable version of `angled`"""
+        await self._send_output_async(self._angled_msg(*args, **kwargs))
+
+    def _angled_msg(self, degrees, speed_primary=1.0, speed_secondary=None, max_power=1.0,
+                    end_state=Motor.END_STATE_BRAKE, use_profile=0b11, wait_complete=True):
         if speed_secondary is None:
             speed_secondary = speed_primary
 
@@ -504,53 +1018,61 @@ class EncodedMotor(Motor):
             speed_primary = -speed_primary
             speed_secondary = -speed_secondary
 
-        params = b""
-        params += pack("<I", degrees)
-        params += pack("<b", self._speed_abs(speed_primary))
         if self.virtual_ports:
-            params += pack("<b", self._speed_abs(speed_secondary))
-
-        params += pack("<B", int(100 * max_power))
-        params += pack("<B", end_state)
-        params += pack("<B", use_profile)
+            params = self._ANGLED_GROUPED.pack(degrees, self._speed_abs(speed_primary), self._speed_abs(speed_secondary),
+                                               int(100 * max_power), end_state, use_profile)
+        else:
+            params = self._ANGLED.pack(degrees, self._speed_abs(speed_primary), int(100 * max_power), end_state,
+                                       use_profile)
 
-        self._send_cmd(self.SUBCMD_START_SPEED_FOR_DEGREES, params, wait_complete)
+        return self._cmd_msg(self.SUBCMD_START_SPEED_FOR_DEGREES, params, wait_complete)
 
     def goto_position(self, degrees_primary, degrees_secondary=None, speed=1.0, max_power=1.0,
                       end_state=Motor.END_STATE_BRAKE, use_profile=0b11, wait_complete=True):
         """
         https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#output-sub-command-gotoabsoluteposition-abspos-speed-maxpower-endstate-useprofile-0x0d
+
+        :return: future of command completion if `wait_complete` is False
         """
+        msg = self._goto_position_msg(degrees_primary, degrees_secondary, speed, max_power, end_state, use_profile)
+        return self._send_completable(msg, wait_complete)
+
+    async def goto_position_async(self, *args, **kwargs):
+        """Awaitable version of `goto_position`"""
+        await self._send_output_async(self._goto_position_msg(*args, **kwargs))
+
+    def _goto_position_msg(self, degrees_primary, degrees_secondary=None, speed=1.0, max_power=1.0,
+                           end_state=Motor.END_STATE_BRAKE, use_profile=0b11, wait_complete=True):
         if degrees_secondary is None:
             degrees_secondary = degrees_primary
 
-        params = b""
-        params += pack("<i", degrees_primary)
         if self.virtual_ports:
-            params += pack("<i", degrees_secondary)
-
-        params += pack("<b", self._speed_abs(speed))
-
-        params += pack("<B", int(100 * max_power))
-        params += pack("<B", end_state)
-        params += pack("<B", use_profile)
+            params = self._POSITION_GROUPED.pack(degrees_primary, degrees_secondary, self._speed_abs(speed),
+                                                 int(100 * max_power), end_state, use_profile)
+        else:
+            params = self._POSITION.pack(degrees_primary, self._speed_abs(speed), int(100 * max_power), end_state,
+                                         use_profile)
 
-        self._send_cmd(self.SUBCMD_GOTO_ABSOLUTE_POSITION, params, wait_complete)
+        return self._cmd_msg(self.SUBCMD_GOTO_ABSOLUTE_POSITION, params, wait_complete)
 
     def _decode_port_data(self, msg):
+        mode = self._mode_of(msg)
         data = msg.payload
-        if self._port_mode.mode == self.SENSOR_ANGLE:
+        if mode == self.SENSOR_ANGLE:
             angle = unpack("<l", data[0:4])[0]
             return angle,
-        elif self._port_mode.mode == self.SENSOR_SPEED:
+        elif mode == self.SENSOR_SPEED:
             speed = unpack("<b", data[0:1])[0]
             return speed,
         else:
             log.debug("Got motor sensor data while in unexpected mode: %r", self._port_mode)
             return ()
 
-    def subscribe(self, callback, mode=SENSOR_ANGLE, granularity=1):
-        super().subscribe(callback, mode, granularity)
+    def subscribe(self, callback, mode=SENSOR_ANGLE, granularity=1, timestamps=False):
+        super().subscribe(callback, mode, granularity, timestamps)
+
+    async def subscribe_async(self, callback, mode=SENSOR_ANGLE, granularity=1, timestamps=False):
+        await super().subscribe_async(callback, mode, granularity, timestamps)
 
     def preset_encoder(self, degrees=0, degrees_secondary=None, only_combined=False):
         """
@@ -561,9 +1083,9 @@ class EncodedMotor(Motor):
             degrees_secondary = degrees
 
         if self.virtual_ports and not only_combined:
-            self._send_cmd(self.SUBCMD_PRESET_ENCODER, pack("<i", degrees) + pack("<i", degrees_secondary))
+            self._send_cmd(self.SUBCMD_PRESET_ENCODER, self._ENCODER_GROUPED.pack(degrees, degrees_secondary))
         else:
-            params = pack("<i", degrees)
+            params = self._ENCODER.pack(degrees)
             self._write_direct_mode(self.SENSOR_ANGLE, params)
 
 
@@ -607,36 +1129,40 @@ class TiltSensor(Peripheral):
         TRI_FRONT: "FRONT",
     }
 
-    def subscribe(self, callback, mode=MODE_3AXIS_SIMPLE, granularity=1):
-        super().subscribe(callback, mode, granularity)
+    def subscribe(self, callback, mode=MODE_3AXIS_SIMPLE, granularity=1, timestamps=False):
+        super().subscribe(callback, mode, granularity, timestamps)
+
+    async def subscribe_async(self, callback, mode=MODE_3AXIS_SIMPLE, granularity=1, timestamps=False):
+        await super().subscribe_async(callback, mode, granularity, timestamps)
 
     def _decode_port_data(self, msg):
+        mode = self._mode_of(msg)
         data = msg.payload
-        if self._port_mode.mode == self.MODE_2AXIS_ANGLE:
+        if mode == self.MODE_2AXIS_ANGLE:
             roll = unpack("<b", data[0:1])[0]
             pitch = unpack("<b", data[1:2])[0]
             return roll, pitch
-        elif self._port_mode.mode == self.MODE_3AXIS_SIMPLE:
+        elif mode == self.MODE_3AXIS_SIMPLE:
             state = usbyte(data, 0)
             return state,
-        elif self._port_mode.mode == self.MODE_2AXIS_SIMPLE:
+        elif mode == self.MODE_2AXIS_SIMPLE:
             state = usbyte(data, 0)
             return state,
-        elif self._port_mode.mode == self.MODE_IMPACT_COUNT:
+        elif mode == self.MODE_IMPACT_COUNT:
             bump_count = usint(data, 0)
             return bump_count,
-        elif self._port_mode.mode == self.MODE_3AXIS_ACCEL:
+        elif mode == self.MODE_3AXIS_ACCEL:
             roll = unpack("<b", data[0:1])[0]
             pitch = unpack("<b", data[1:2])[0]
             yaw = unpack("<b", data[2:3])[0]  # did I get the order right?
             return roll, pitch, yaw
-        elif self._port_mode.mode == self.MODE_ORIENT_CF:
+        elif mode == self.MODE_ORIENT_CF:
             state = usbyte(data, 0)
             return state,
-        elif self._port_mode.mode == self.MODE_IMPACT_CF:
+        elif mode == self.MODE_IMPACT_CF:
             state = usbyte(data, 0)
             return state,
-        elif self._port_mode.mode == self.MODE_CALIBRATION:
+        elif mode == self.MODE_CALIBRATION:
             return usbyte(data, 0), usbyte(data, 1), usbyte(data, 2)
         else:
             log.debug("Got tilt sensor data while in unexpected mode: %r", self._port_mode)
@@ -663,46 +1189,50 @@ class VisionSensor(Peripheral):
     def __init__(self, parent, port):
         super().__init__(parent, port)
 
-    def subscribe(self, callback, mode=COLOR_DISTANCE_FLOAT, granularity=1):
-        super().subscribe(callback, mode, granularity)
+    def subscribe(self, callback, mode=COLOR_DISTANCE_FLOAT, granularity=1, timestamps=False):
+        super().subscribe(callback, mode, granularity, timestamps)
+
+    async def subscribe_async(self, callback, mode=COLOR_DISTANCE_FLOAT, granularity=1, timestamps=False):
+        await super().subscribe_async(callback, mode, granularity, timestamps)
 
     def _decode_port_data(self, msg):
+        mode = self._mode_of(msg)
         data = msg.payload
-        if self._port_mode.mode == self.COLOR_INDEX:
+        if mode == self.COLOR_INDEX:
             color = usbyte(data, 0)
             return color,
-        elif self._port_mode.mode == self.COLOR_DISTANCE_FLOAT:
+        elif mode == self.COLOR_DISTANCE_FLOAT:
             color = usbyte(data, 0)
             val = usbyte(data, 1)
             partial = usbyte(data, 3)
             if partial:
                 val += 1.0 / partial
             return color, float(val)
-        elif self._port_mode.mode == self.DISTANCE_INCHES:
+        elif mode == self.DISTANCE_INCHES:
             val = usbyte(data, 0)
             return val,
-        elif self._port_mode.mode == self.DISTANCE_REFLECTED:
+        elif mode == self.DISTANCE_REFLECTED:
             val = usbyte(data, 0) / 100.0
             return val,
-        elif self._port_mode.mode == self.AMBIENT_LIGHT:
+        elif mode == self.AMBIENT_LIGHT:
             val = usbyte(data, 0) / 100.0
             return val,
-        elif self._port_mode.mode == self.COUNT_2INCH:
+        elif mode == self.COUNT_2INCH:
             count = usint(data, 0)
             return count,
-        elif self._port_mode.mode == self.COLOR_RGB:
+        elif mode == self.COLOR_RGB:
             val1 = int(255 * ushort(data, 0) / 1023.0)
             val2 = int(255 * ushort(data, 2) / 1023.0)
             val3 = int(255 * ushort(data, 4) / 1023.0)
             return val1, val2, val3
-        elif self._port_mode.mode == self.DEBUG:
+        elif mode == self.DEBUG:
             val1 = 10 * ushort(data, 0) / 1023.0
             val2 = 10 * ushort(data, 2) / 1023.0
             return val1, val2
-        elif self._port_mode.mode == self.CALIBRATE:
+        elif mode == self.CALIBRATE:
             return [ushort(data, x * 2) for x in range(8)]
         else:
-            log.debug("Unhandled VisionSensor data in mode %s: %s", self._port_mode.mode, str2hex(data))
+            log.debug("Unhandled VisionSensor data in mode %s: %s", mode, str2hex(data))
             return ()
 
     def set_color(self, color):
@@ -718,7 +1248,7 @@ class VisionSensor(Peripheral):
             raise ValueError("Color %s is not in list of available colors" % color)
 
         self.set_port_mode(self.SET_COLOR)
-        payload = pack("<B", self.SET_COLOR) + pack("<B", color)
+        payload = _MODE_BYTE.pack(self.SET_COLOR, color)
 
         msg = MsgPortOutput(self.port, MsgPortOutput.WRITE_DIRECT_MODE_DATA, payload)
         self._send_output(msg)
@@ -726,7 +1256,7 @@ class VisionSensor(Peripheral):
     def set_ir_tx(self, level=1.0):
         assert 0 <= level <= 1.0
         self.set_port_mode(self.SET_IR_TX)
-        payload = pack("<B", self.SET_IR_TX) + pack("<H", int(level * 65535))
+        payload = _MODE_SHORT.pack(self.SET_IR_TX, int(level * 65535))
 
         msg = MsgPortOutput(self.port, MsgPortOutput.WRITE_DIRECT_MODE_DATA, payload)
         self._send_output(msg)
@@ -832,35 +1362,26 @@ class Current(Peripheral):
 
 class Button(Peripheral):
     """
-    It's not really a peripheral, we use MSG_DEVICE_INFO commands to interact with it
+    It's not really a peripheral, its state is hub property, subscriptions are shared with `hub.properties`
     """
 
     def __init__(self, parent):
         super().__init__(parent, 0)  # fake port 0
-        self.hub.add_message_handler(MsgHubProperties, self._props_msg)
 
-    def subscribe(self, callback, mode=None, granularity=1):
-        self.hub.send(MsgHubProperties(MsgHubProperties.BUTTON, MsgHubProperties.UPD_ENABLE))
+    def _attach(self):
+        pass  # updates come through hub properties
 
-        if callback:
-            self._subscribers.add(callback)
+    def subscribe(self, callback, mode=None, granularity=1, timestamps=False):
+        self.hub.properties.subscribe(MsgHubProperties.BUTTON, callback, timestamps)
+
+    async def subscribe_async(self, callback, mode=None, granularity=1, timestamps=False):
+        await self.hub.properties.subscribe_async(MsgHubProperties.BUTTON, callback, timestamps)
 
     def unsubscribe(self, callback=None):
-        if callback in self._subscribers:
-            self._subscribers.remove(callback)
+        self.hub.properties.unsubscribe(MsgHubProperties.BUTTON, callback)
 
-        if not self._subscribers:
-            self.hub.send(MsgHubProperties(MsgHubProperties.BUTTON, MsgHubProperties.UPD_DISABLE))
-
-    def _props_msg(self, msg):
-        """
-        :type msg: MsgHubProperties
-        """
-        if (
-                msg.property == MsgHubProperties.BUTTON
-                and msg.operation == MsgHubProperties.UPSTREAM_UPDATE
-        ):
-            self._notify_subscribers(usbyte(msg.parameters, 0))
+    async def unsubscribe_async(self, callback=None):
+        await self.hub.properties.unsubscribe_async(MsgHubProperties.BUTTON, callback)
 
 
 class RemoteButton(Peripheral):
@@ -882,15 +1403,33 @@ class RemoteButton(Peripheral):
     def __init__(self, parent, port):
         super().__init__(parent, port)
 
-        self.hub.add_message_handler(MsgHubProperties, self._props_msg)
-
-    def subscribe(self, callback, mode=0x00, granularity=1):
+    def subscribe(self, callback, mode=0x00, granularity=1, timestamps=False):
         # override base class to prevent invalid mode
         if mode not in [self.RCKEY, self.KEYR, self.KEYA]:
             log.debug("Invalid mode: %i", mode)
             raise ValueError("Invalid mode: ", mode)
 
-        super().subscribe(callback, mode)
+        super().subscribe(callback, mode, timestamps=timestamps)
+        # green button is hub property, its subscription is shared with `hub.properties`
+        self.hub.properties.subscribe(MsgHubProperties.BUTTON, self._handle_hub_button, timestamps=True)
+
+    async def subscribe_async(self, callback, mode=0x00, granularity=1, timestamps=False):
+        if mode not in [self.RCKEY, self.KEYR, self.KEYA]:
+            log.debug("Invalid mode: %i", mode)
+            raise ValueError("Invalid mode: ", mode)
+
+        await super().subscribe_async(callback, mode, timestamps=timestamps)
+        await self.hub.properties.subscribe_async(MsgHubProperties.BUTTON, self._handle_hub_button, timestamps=True)
+
+    def unsubscribe(self, callback=None):
+        super().unsubscribe(callback)
+        if not self._subscribers:
+            self.hub.properties.unsubscribe(MsgHubProperties.BUTTON, self._handle_hub_button)
+
+    async def unsubscribe_async(self, callback=None):
+        await super().unsubscribe_async(callback)
+        if not self._subscribers:
+            await self.hub.properties.unsubscribe_async(MsgHubProperties.BUTTON, self._handle_hub_button)
 
     def _decode_port_data(self, msg):
         button = self.button_events[msg.payload]
@@ -902,20 +1441,17 @@ class RemoteButton(Peripheral):
         """
         :type msg: pylgbst.messages.MsgPortValueSingle
         """
+        if isinstance(msg, MsgPortValueCombined):
+            self._handle_combined_data(msg)
+            return
+
         decoded = self._decode_port_data(msg)
         if decoded is not None:
             assert isinstance(decoded, (tuple, list)), "Unexpected data type: %s" % type(decoded)
-            self._notify_subscribers(*decoded)
+            self._notify_subscribers(*decoded, timestamp=msg.timestamp)
 
-    def _props_msg(self, msg):
-        """
-        :type msg: MsgHubProperties
-        """
-        if (
-                msg.property == MsgHubProperties.BUTTON
-                and msg.operation == MsgHubProperties.UPSTREAM_UPDATE
-        ):
-            self._notify_subscribers(usbyte(msg.parameters, 0))
+    def _handle_hub_button(self, timestamp, pressed):
+        self._notify_subscribers(pressed, timestamp=timestamp)
 
 
 class Temperature(Peripheral):
@@ -2,10 +2,14 @@
 This module offers some utilities, in a way they are work in both Python 2 and 3
 """
 
+import asyncio
 import binascii
+import collections
 import logging
 import math
 import sys
+import threading
+import traceback
 from struct import unpack
 
 log = logging.getLogger(__name__)
@@ -37,6 +41,15 @@ def usint(seq, index):
     return check_unpack(seq, index, "<I", 4)
 
 
+def version_str(ver):
+    """
+    Formats version number encoded as in https://lego.github.io/lego-ble-wireless-protocol-docs/index.html#ver-no
+    :type ver: int
+    :rtype: str
+    """
+    return "%d.%d.%02x.%04x" % ((ver >> 28) & 0x07, (ver >> 24) & 0x0F, (ver >> 16) & 0xFF, ver & 0xFFFF)
+
+
 def str2hex(data):  # we need it for python 2+3 compatibility
     # if sys.version_info[0] == 3:
     # data = bytes(data, 'ascii')
@@ -46,6 +59,201 @@ def str2hex(data):  # we need it for python 2+3 compatibility
     return hexed
 
 
+class LazyHex:
+    """
+    Hex representation of data that is computed only when logging actually formats the record
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return str2hex(self.data).decode("ascii")
+
+
+class PortDataBuffer:
+    """
+    Buffer of port data between notification thread and its consumer, with selectable policy for overflow:
+    - `LATEST` keeps only `maxsize` freshest items, dropping the oldest ones
+    - `FIFO` keeps `maxsize` oldest items, dropping new ones
+    - `UNBOUNDED` keeps everything
+    - `BLOCK` makes producer wait for free space, item is dropped if `timeout` passes
+    """
+
+    LATEST = "latest"
+    FIFO = "fifo"
+    UNBOUNDED = "unbounded"
+    BLOCK = "block"
+
+    def __init__(self, policy=LATEST, maxsize=1, timeout=None):
+        assert policy in (self.LATEST, self.FIFO, self.UNBOUNDED, self.BLOCK), "Unknown policy: %s" % policy
+        assert policy == self.UNBOUNDED or maxsize > 0
+        self.policy = policy
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.received = 0
+        self.drops = 0
+        self.max_depth = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def put(self, item):
+        """
+        :return: False if some item got dropped
+        """
+        with self._cond:
+            self.received += 1
+            accepted = True
+            if self.policy != self.UNBOUNDED and len(self._items) >= self.maxsize:
+                if self.policy == self.LATEST:
+                    self._items.popleft()
+                    self.drops += 1
+                    accepted = False
+                elif self.policy == self.FIFO or not self._cond.wait_for(self._has_space, self.timeout):
+                    self.drops += 1
+                    return False
+
+            self._items.append(item)
+            self.max_depth = max(self.max_depth, len(self._items))
+            return accepted
+
+    def get_nowait(self):
+        """
+        :raises queue.Empty: when there is nothing buffered
+        """
+        with self._cond:
+            if not self._items:
+                raise queue.Empty()
+            item = self._items.popleft()
+            self._cond.notify()
+            return item
+
+    def _has_space(self):
+        return len(self._items) < self.maxsize
+
+
+class Dispatcher:
+    """
+    Runs jobs on a bounded pool of worker threads, shared by many job sources.
+    Job is a callable that is scheduled at most once at a time, so it never runs concurrently with itself.
+    Scheduling a job while it runs makes it run once more afterwards, so nothing scheduled is missed.
+    Workers are started on demand and exit after being idle for `idle_timeout` seconds.
+    """
+
+    _QUEUED = 0
+    _RUNNING = 1
+    _RERUN = 2
+
+    def __init__(self, workers=1, name="Dispatcher", idle_timeout=5.0):
+        assert workers > 0
+        self.workers = workers
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._jobs = {}  # job => its state
+        self._threads = []
+        self._idle = 0
+
+    def schedule(self, job):
+        with self._cond:
+            state = self._jobs.get(job)
+            if state == self._RUNNING:
+                self._jobs[job] = self._RERUN
+            if state is not None:
+                return
+
+            self._jobs[job] = self._QUEUED
+            self._pending.append(job)
+            if self._idle:
+                self._cond.notify()
+            elif len(self._threads) < self.workers:
+                thr = threading.Thread(target=self._work)
+                thr.daemon = True
+                thr.name = "%s worker %s" % (self.name, len(self._threads))
+                self._threads.append(thr)
+                thr.start()
+
+    def _work(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._idle += 1
+                    self._cond.wait(self.idle_timeout)
+                    self._idle -= 1
+                    if not self._pending:
+                        self._threads.remove(threading.current_thread())
+                        return
+                    continue
+
+                job = self._pending.popleft()
+                self._jobs[job] = self._RUNNING
+                self._cond.release()
+                try:
+                    job()
+                except BaseException:
+                    log.warning("%s", traceback.format_exc())
+                    log.warning("Failed to run job %s", job)
+                finally:
+                    self._cond.acquire()
+
+                if self._jobs[job] == self._RERUN:
+                    self._jobs[job] = self._QUEUED
+                    self._pending.append(job)
+                else:
+                    del self._jobs[job]
+
+
+class Subscriber:
+    """
+    Subscriber callback wrapper, optionally passing receipt timestamp in front of values.
+    Compares equal to the wrapped callback, so it can be unsubscribed with it.
+    """
+
+    def __init__(self, callback, timestamps=False):
+        self.callback = callback
+        self.timestamps = timestamps
+
+    def notify(self, args, timestamp):
+        if self.timestamps:
+            args = (timestamp,) + args
+        self.callback(*args)
+
+    def __eq__(self, other):
+        if isinstance(other, Subscriber):
+            other = other.callback
+        return self.callback == other
+
+    def __hash__(self):
+        return hash(self.callback)
+
+
+class LoopCallback(Subscriber):
+    """
+    Subscriber wrapper that passes values into the event loop it was created for.
+    """
+
+    def __init__(self, loop, callback, timestamps=False):
+        super().__init__(callback, timestamps)
+        self.loop = loop
+
+    def notify(self, args, timestamp):
+        if self.timestamps:
+            args = (timestamp,) + args
+        self.loop.call_soon_threadsafe(self._run, args)
+
+    def _run(self, args):
+        res = self.callback(*args)
+        if asyncio.iscoroutine(res):
+            self.loop.create_task(res)
+
+
 def abs_scaled_100(relative):
     if relative < -1.0:
         log.warning("Speed cannot be less than -1")
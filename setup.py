@@ -25,5 +25,6 @@ setup(
         "pygatt": ["pygatt", "pexpect"],
         "bluepy": ["bluepy"],
         "bleak": ["bleak"],
+        "numpy": ["numpy"],  # for sensor history
     },
 )
@@ -1,6 +1,7 @@
 import sys
 import time
 from binascii import unhexlify
+from threading import Thread
 
 from pylgbst.comms import Connection
 from pylgbst.hub import MoveHub, Hub
@@ -85,3 +86,4 @@ class ConnectionMock(Connection):
             if self.finished:
                 log.debug("Done waiting for notifications to process")
                 break
+
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+import unittest
+
+from pylgbst.capabilities import CapabilityCache, PortCapabilities, discover_port
+from pylgbst.hub import Hub
+from pylgbst.messages import MsgPortModeInfoRequest
+from tests import ConnectionMock
+
+
+class DiscoveryConnection(ConnectionMock):
+    """
+    Port with two combinable modes, that have only name and value format infos
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.hub = None
+        self.max_pending = 0
+
+    def write(self, handle, data):
+        super().write(handle, data)
+        if self.hub is not None:
+            self.max_pending = max(self.max_pending, len(self.hub._sync_requests))
+
+        if len(data) < 5:
+            return
+        port = data[3]
+        if data[2] == 0x21 and data[4] == 0x01:
+            self.notifications.append('0b0043%02x01070201000200' % port)  # mode 0 is input, mode 1 is output
+        elif data[2] == 0x21 and data[4] == 0x02:
+            self.notifications.append('070043%02x020300' % port)
+        elif data[2] == 0x22 and data[5] == MsgPortModeInfoRequest.INFO_NAME:
+            self.notifications.append('0c0044%02x%02x00' % (port, data[4]) + (b"MODE%d\x00" % data[4]).hex())
+        elif data[2] == 0x22 and data[5] == MsgPortModeInfoRequest.INFO_VALUE_FORMAT:
+            self.notifications.append('0a0044%02x%02x8001000300' % (port, data[4]))
+        elif data[2] == 0x22:
+            self.notifications.append('0500052206')  # invalid use
+
+
+class CapabilityCacheTest(unittest.TestCase):
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = CapabilityCache(os.path.join(tmp, "sub"))
+            self.assertIsNone(cache.load(0x26, "1.0.00.0000", "1.0.00.0000"))
+
+            cache.save(0x26, "1.0.00.0000", "1.0.00.0000", {"mode_count": 4, "modes": [{"raw": b"\x01"}]})
+            self.assertEqual({"mode_count": 4, "modes": [{"raw": "01"}]},
+                             cache.load(0x26, "1.0.00.0000", "1.0.00.0000"))
+            self.assertIsNone(cache.load(0x26, "1.0.00.0000", "1.0.00.0001"))  # other firmware
+            self.assertEqual(1, len(os.listdir(os.path.join(tmp, "sub"))))
+
+    def test_discovery(self):
+        conn = DiscoveryConnection().connect()
+        hub = Hub(conn)
+        conn.hub = hub
+
+        caps = discover_port(hub, 0x01, window=4, timeout=1)
+        self.assertEqual(2, caps.total_modes)
+        self.assertEqual([[0, 1]], caps.mode_combinations)
+        self.assertEqual(["MODE0"], [x.name for x in caps.input_modes])
+        self.assertEqual(["MODE1"], [x.name for x in caps.output_modes])
+        self.assertEqual(1, caps.modes[1].value_format["datasets"])
+        self.assertIsNone(caps.modes[1].units)
+
+        mode_requests = [x[1] for x in conn.writes if x[1][4:6] == b"22"]
+        self.assertEqual(2 * len(MsgPortModeInfoRequest.INFO_TYPES), len(mode_requests))
+        self.assertEqual(len(mode_requests), len(set(mode_requests)))  # nothing is asked twice
+        self.assertGreater(conn.max_pending, 1)  # requests were pipelined
+        self.assertLessEqual(conn.max_pending, 4)
+        self.assertEqual([], hub._sync_requests)
+
+        restored = PortCapabilities.from_dict(caps.to_dict())
+        self.assertEqual(caps.to_dict(), restored.to_dict())
+        conn.wait_notifications_handled()
+
+    def test_peripheral(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+        conn.notifications.append('0f0004010126000000001000000110')
+        time.sleep(0.1)
+
+        motor = hub.peripherals[0x01]
+        self.assertEqual((0x26, "1.0.00.0000", "1.0.01.0000"), (motor.dev_type, motor.hw_revision, motor.sw_revision))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            hub.capability_cache = CapabilityCache(tmp)
+            caps = PortCapabilities(0x02)
+            caps.total_modes = 4
+            hub.capability_cache.save(0x26, "1.0.00.0000", "1.0.01.0000", caps.to_dict())
+            caps = motor.describe_possible_modes()
+            self.assertEqual((0x01, 4), (caps.port, caps.total_modes))
+            self.assertEqual(1, len(conn.writes))  # nothing requested from hub
+        conn.wait_notifications_handled()
@@ -7,6 +7,7 @@ from packaging import version
 
 import pylgbst
 import pylgbst.comms.cbleak as cbleak
+from pylgbst.comms.fakebleak import fake_bleak_connection
 
 bleak.BleakClient = object()
 bleak.discover = object()
@@ -23,36 +24,26 @@ class BleakDriverTest(unittest.TestCase):
 
     @unittest.skipIf(lt37, "Python version is too low")
     def test_communication(self):
-        driver = cbleak.BleakDriver()
-
-        async def fake_thread():
-            print('Fake thread initialized')
-            while not driver._abort:
-                time.sleep(0.1)
-                if driver.req_queue.qsize() != 0:
-                    print('Received data, sending back')
-                    data = driver.req_queue.get()
-                    driver.resp_queue.put(data)
-
-        driver._bleak_thread = fake_thread
-        driver.set_notify_handler(BleakDriverTest.validation_handler)
-        driver.enable_notifications()
-
-        time.sleep(0.5)  # time for driver initialization
-        self.assertTrue(driver.is_alive(), 'Checking that driver starts')
-        handle = 0x32
-        data = [0xD, 0xE, 0xA, 0xD, 0xB, 0xE, 0xE, 0xF]
-        driver.write(handle, data)
-        time.sleep(0.5)  # processing time
-        self.assertEqual(handle, last_response[0], 'Verifying response handle')
-        self.assertEqual(bytes(data), last_response[1], 'Verifying response data')
-
-        driver.disconnect()
-        time.sleep(0.5)  # processing time
-        self.assertFalse(driver.is_alive())
+        with fake_bleak_connection():
+            driver = cbleak.BleakDriver()
+            driver.set_notify_handler(BleakDriverTest.validation_handler)
+            driver.enable_notifications()
+
+            time.sleep(0.5)  # time for driver initialization
+            self.assertTrue(driver.is_alive(), 'Checking that driver starts')
+            handle = 0x32
+            data = [0xD, 0xE, 0xA, 0xD, 0xB, 0xE, 0xE, 0xF]
+            driver.write(handle, data)
+            time.sleep(0.1)  # processing time, there is no polling delay anymore
+            self.assertEqual(handle, last_response[0], 'Verifying response handle')
+            self.assertEqual(bytes(data), last_response[1], 'Verifying response data')
+
+            driver.disconnect()
+            time.sleep(0.5)  # processing time
+            self.assertFalse(driver.is_alive())
 
     @staticmethod
-    def validation_handler(handle, data):
+    def validation_handler(handle, data, timestamp=None):
         global last_response
         last_response = (handle, data)
 
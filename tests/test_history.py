@@ -0,0 +1,72 @@
+import time
+import unittest
+
+from pylgbst.hub import MoveHub
+from pylgbst.peripherals import EncodedMotor
+from tests import HubMock
+from tests.test_peripherals import CombinedModeConnection
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class SensorHistoryTest(unittest.TestCase):
+    def test_ring(self):
+        from pylgbst.history import SensorHistory
+
+        history = SensorHistory(4)
+        timestamps, values = history.last()
+        self.assertEqual(0, len(timestamps))
+
+        for x in range(6):
+            history.append(x * 10, (x, -x))
+
+        self.assertEqual(4, len(history))
+        timestamps, values = history.last()
+        self.assertEqual([20, 30, 40, 50], timestamps.tolist())
+        self.assertEqual([[2, -2], [3, -3], [4, -4], [5, -5]], values.tolist())
+        self.assertIsNotNone(values.base)  # view, not copy
+
+        timestamps, values = history.last(2)
+        self.assertEqual([40, 50], timestamps.tolist())
+
+        timestamps, values = history.since(35)
+        self.assertEqual([4, 5], values[:, 0].tolist())
+
+        history.append(60, (1,))  # different number of values resets history
+        self.assertEqual([[1]], history.last()[1].tolist())
+
+    def test_peripheral(self):
+        hub = HubMock()
+        motor = EncodedMotor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = motor
+        history = motor.enable_history(10)
+
+        hub.connection.notification_delayed('0a004702020100000001', 0.1)
+        motor.subscribe(None)
+        hub.connection.notification_delayed("0800450200000000", 0.1)
+        hub.connection.notification_delayed("08004502ffffffff", 0.2)
+        time.sleep(0.3)
+        hub.connection.wait_notifications_handled()
+
+        timestamps, values = history.last()
+        self.assertEqual([[0], [-1]], values.tolist())
+        self.assertLess(timestamps[0], timestamps[1])
+
+    def test_combined_mode(self):
+        hub = HubMock(CombinedModeConnection())
+        motor = EncodedMotor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = motor
+        history = motor.enable_history(10)
+
+        motor.subscribe_combined(None, [EncodedMotor.SENSOR_SPEED, EncodedMotor.SENSOR_ANGLE])
+        hub.connection.notification_delayed('0a0046020200b4000000', 0.1)  # only angle updated
+        time.sleep(0.2)
+        hub.connection.wait_notifications_handled()
+
+        timestamps, values = history.last()
+        self.assertEqual([[5, 90], [5, 180]], values.tolist())  # speed and angle in each sample
+        self.assertLess(timestamps[0], timestamps[1])
@@ -1,10 +1,12 @@
+import asyncio
 import time
 import unittest
+from threading import Thread
 
-from pylgbst.hub import Hub, MoveHub
-from pylgbst.messages import MsgHubAction, MsgHubAlert, MsgHubProperties
+from pylgbst.hub import Hub, MoveHub, SmartHub
+from pylgbst.messages import MsgHubAction, MsgHubAlert, MsgHubProperties, MsgPortValueSingle
 from pylgbst.peripherals import VisionSensor
-from pylgbst.utilities import usbyte
+from pylgbst.utilities import LazyHex, usbyte
 from tests import ConnectionMock
 
 
@@ -28,6 +30,147 @@ class HubTest(unittest.TestCase):
 
         conn.wait_notifications_handled()
 
+    def test_property_subscriptions(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+
+        vals1, vals2 = [], []
+        timed = lambda timestamp, value: vals2.append((timestamp, value))
+        conn.notification_delayed('0600010506c4', 0.1)  # RSSI -60
+        hub.properties.subscribe(MsgHubProperties.RSSI, vals1.append)
+        hub.properties.subscribe(MsgHubProperties.RSSI, timed, timestamps=True)
+        self.assertEqual([b"0500010502"], [x[1] for x in conn.writes[1:]])  # single hub subscription
+        self.assertEqual(-60, hub.properties.get(MsgHubProperties.RSSI))  # no request, value is kept up to date
+
+        conn.notification_delayed('0600010506c0', 0.1)
+        time.sleep(0.2)
+        self.assertEqual([-64], vals1)
+        self.assertEqual(-64, vals2[0][1])
+        self.assertEqual(vals2[0][0], hub.properties.last(MsgHubProperties.RSSI)[0])
+
+        hub.properties.unsubscribe(MsgHubProperties.RSSI, vals1.append)
+        self.assertEqual(2, len(conn.writes))
+        hub.properties.unsubscribe(MsgHubProperties.RSSI, timed)
+        self.assertEqual(b"0500010503", conn.writes[2][1])
+
+        conn.notification_delayed('0600010506b0', 0.1)
+        self.assertEqual(-80, hub.properties.get(MsgHubProperties.RSSI))  # requested, as not subscribed anymore
+        self.assertEqual(-80, hub.properties.get(MsgHubProperties.RSSI, max_age=10))
+        self.assertEqual(4, len(conn.writes))
+        conn.wait_notifications_handled()
+
+    def test_failed_property_subscription(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn, timeout=0.1)
+
+        conn.notification_delayed('0600010506c4', 0.05)
+        self.assertEqual(-60, hub.properties.get(MsgHubProperties.RSSI))
+
+        self.assertRaises(TimeoutError, hub.properties.subscribe, MsgHubProperties.RSSI, None)  # no reply
+        self.assertNotIn(MsgHubProperties.RSSI, hub.properties._subscribers)
+
+        conn.notification_delayed('0600010506c0', 0.05)
+        self.assertEqual(-64, hub.properties.get(MsgHubProperties.RSSI))  # stale value is not served
+
+        conn.notification_delayed('0600010506c0', 0.05)
+        hub.properties.subscribe(MsgHubProperties.RSSI, None)
+        self.assertEqual([b"0500010505", b"0500010502", b"0500010505", b"0500010502"], [x[1] for x in conn.writes[1:]])
+        conn.wait_notifications_handled()
+
+    def test_concurrent_requests(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+
+        replies = {}
+
+        def request(prop):
+            replies[prop] = hub.send(MsgHubProperties(prop, MsgHubProperties.UPD_REQUEST))
+
+        thr = Thread(target=request, args=(MsgHubProperties.VOLTAGE_PERC,))
+        thr.start()
+        time.sleep(0.1)
+
+        # second request is sent while first one is still pending, replies come in reverse order
+        conn.notification_delayed('12000101064c45474f204d6f766520487562', 0.1)
+        conn.notification_delayed('060001060640', 0.2)
+        request(MsgHubProperties.ADVERTISE_NAME)
+        thr.join(1)
+
+        self.assertFalse(thr.is_alive())
+        self.assertEqual(b"LEGO Move Hub", replies[MsgHubProperties.ADVERTISE_NAME].parameters)
+        self.assertEqual(b"\x40", replies[MsgHubProperties.VOLTAGE_PERC].parameters)
+        conn.wait_notifications_handled()
+
+    def test_request_timeout(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn, timeout=0.1)
+
+        msg = MsgHubProperties(MsgHubProperties.VOLTAGE_PERC, MsgHubProperties.UPD_REQUEST)
+        self.assertRaises(TimeoutError, hub.send, msg)
+        self.assertEqual([], hub._sync_requests)
+
+        reply = hub.send_request(MsgHubProperties(MsgHubProperties.RSSI, MsgHubProperties.UPD_REQUEST))
+        reply.cancel()
+        self.assertEqual([], hub._sync_requests)
+
+        # hub is not wedged by lost replies
+        conn.notification_delayed('060001060640', 0.1)
+        resp = hub.send(MsgHubProperties(MsgHubProperties.VOLTAGE_PERC, MsgHubProperties.UPD_REQUEST), timeout=1)
+        self.assertEqual(b"\x40", resp.parameters)
+        conn.wait_notifications_handled()
+
+    def test_send_async(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+
+        async def requests():
+            msg1 = MsgHubProperties(MsgHubProperties.VOLTAGE_PERC, MsgHubProperties.UPD_REQUEST)
+            msg2 = MsgHubProperties(MsgHubProperties.ADVERTISE_NAME, MsgHubProperties.UPD_REQUEST)
+            return await asyncio.gather(hub.send_async(msg1), hub.send_async(msg2))
+
+        conn.notification_delayed('12000101064c45474f204d6f766520487562', 0.1)
+        conn.notification_delayed('060001060640', 0.2)
+        voltage, name = asyncio.run(requests())
+        self.assertEqual(b"\x40", voltage.parameters)
+        self.assertEqual(b"LEGO Move Hub", name.parameters)
+
+        msg = MsgHubProperties(MsgHubProperties.RSSI, MsgHubProperties.UPD_REQUEST)
+        self.assertRaises(TimeoutError, asyncio.run, hub.send_async(msg, timeout=0.1))
+        self.assertEqual([], hub._sync_requests)
+        conn.wait_notifications_handled()
+
+    def test_tracer(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+        trace = []
+        hub.tracer = lambda direction, handle, data, msg: trace.append((direction, handle, data, msg))
+
+        conn.notification_delayed('060001060640', 0.1)
+        resp = hub.send(MsgHubProperties(MsgHubProperties.VOLTAGE_PERC, MsgHubProperties.UPD_REQUEST))
+        conn.wait_notifications_handled()
+
+        self.assertEqual(["out", "in"], [x[0] for x in trace])
+        self.assertEqual(b"\x05\x00\x01\x06\x05", trace[0][2])
+        self.assertIs(resp, trace[1][3])
+        self.assertEqual("0500010605", str(LazyHex(trace[0][2])))
+
+    def test_message_handlers(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+
+        props = []
+        conn.notifications.append('060001060640')
+        time.sleep(0.1)
+
+        # handler added after index for the class got filled
+        hub.add_message_handler(MsgHubProperties, props.append)
+        hub.add_message_handler(MsgHubAction, props.append)
+        conn.notifications.append('060001060641')
+        conn.wait_notifications_handled()
+
+        self.assertEqual(1, len(props))
+        self.assertEqual(b"\x41", props[0].parameters)
+
     def test_device_attached(self):
         conn = ConnectionMock().connect()
         hub = Hub(conn)
@@ -39,12 +182,17 @@ class HubTest(unittest.TestCase):
         # detach and reattach
         conn.notifications.append('0500040100')
         conn.notifications.append('0500040200')
+        time.sleep(0.1)
+        self.assertEqual({}, hub._port_handlers)
+
         conn.notifications.append('0f0004010126000000001000000010')
         conn.notifications.append('0f0004020125000000001000000010')
-
-        del hub
         conn.wait_notifications_handled()
 
+        self.assertEqual(9, len(hub._port_handlers))
+        self.assertEqual([hub.peripherals[0x02].queue_port_data],
+                         hub._port_handlers[(MsgPortValueSingle, 0x02)])
+
     def test_hub_actions(self):
         conn = ConnectionMock().connect()
         hub = Hub(conn)
@@ -68,6 +216,40 @@ class HubTest(unittest.TestCase):
         hub.send(MsgHubAlert(MsgHubAlert.LOW_SIGNAL, MsgHubAlert.UPD_REQUEST))
         conn.wait_notifications_handled()
 
+    def test_alert_subscriptions(self):
+        conn = ConnectionMock().connect()
+        hub = Hub(conn)
+
+        alerts = []
+        callback = lambda atype, raised: alerts.append((atype, raised))
+        hub.alerts.subscribe(callback)
+        hub.alerts.subscribe(None)
+        self.assertEqual([b"0500030101", b"0500030201", b"0500030301", b"0500030401"], [x[1] for x in conn.writes[1:]])
+        self.assertEqual([], hub._sync_requests)  # enabling takes no request slots
+
+        conn.notifications.append('0600030404ff')
+        conn.notifications.append('060003040400')
+        conn.notifications.append('0600030304ff')
+        time.sleep(0.1)
+        self.assertEqual([(4, True), (4, False), (3, True)], alerts)
+        self.assertEqual(1, hub.alerts.counts[MsgHubAlert.OVER_POWER])
+        self.assertFalse(hub.alerts.active[MsgHubAlert.OVER_POWER])
+        self.assertTrue(hub.alerts.active[MsgHubAlert.LOW_SIGNAL])
+
+        self.assertTrue(hub.alerts.get(MsgHubAlert.LOW_SIGNAL))
+        self.assertEqual(5, len(conn.writes))  # updated state is used
+        conn.notification_delayed('0600030104ff', 0.1)
+        self.assertTrue(hub.alerts.get(MsgHubAlert.LOW_VOLTAGE))  # no update yet, so it is requested
+        self.assertEqual(b"0500030103", conn.writes[5][1])
+        self.assertTrue(hub.alerts.get(MsgHubAlert.LOW_VOLTAGE))
+        self.assertEqual(6, len(conn.writes))
+
+        hub.alerts.unsubscribe(None)
+        self.assertEqual(6, len(conn.writes))
+        hub.alerts.unsubscribe(callback)
+        self.assertEqual(b"0500030402", conn.writes[-1][1])
+        conn.wait_notifications_handled()
+
     def test_error(self):
         conn = ConnectionMock().connect()
         hub = Hub(conn)
@@ -132,14 +314,62 @@ class MoveHubTest(unittest.TestCase):
         conn.notifications.append('0f00 04 3b 0115000200000002000000')
         conn.notifications.append('0f00 04 3c 0114000200000002000000')
 
-        conn.notification_delayed('12000101064c45474f204d6f766520487562', 1.1)
-        conn.notification_delayed('0b00010d06001653a0d1d4', 1.3)
-        conn.notification_delayed('060001060600', 1.5)
-        conn.notification_delayed('0600030104ff', 1.7)
-        MoveHub(conn.connect())
-        time.sleep(1)
-        conn.wait_notifications_handled()
+        hub = MoveHub(conn.connect())
+        self.assertEqual(1, len(conn.writes))  # no info requests on startup
+        self.assertEqual({}, hub.info)
+
+        # all requests are sent before the first reply comes
+        conn.notification_delayed('12000101064c45474f204d6f766520487562', 0.1)
+        conn.notification_delayed('0b00010d06001653a0d1d4', 0.1)
+        conn.notification_delayed('060001060640', 0.1)
+        conn.notification_delayed('0600030104ff', 0.1)
+        start = time.time()
+        self.assertEqual({"name": "LEGO Move Hub", "mac": "00:16:53:a0:d1:d4", "voltage_level": 64, "low_voltage": True},
+                         hub.fetch_info())
+        self.assertLess(time.time() - start, 0.3)
         self.assertEqual(b"0500010105", conn.writes[1][1])
         self.assertEqual(b"0500010d05", conn.writes[2][1])
         self.assertEqual(b"0500010605", conn.writes[3][1])
         self.assertEqual(b"0500030103", conn.writes[4][1])
+
+        self.assertEqual("LEGO Move Hub", hub.name)
+        self.assertEqual("00:16:53:a0:d1:d4", hub.mac)
+        self.assertEqual(64, hub.voltage_level)
+        self.assertEqual(5, len(conn.writes))  # name and MAC are cached, battery level is recent enough
+        self.assertEqual({"name": "LEGO Move Hub", "mac": "00:16:53:a0:d1:d4"}, hub.info)
+
+        conn.notification_delayed('060003010400', 0.1)
+        self.assertFalse(hub.low_voltage)  # alert state is requested each time
+        self.assertEqual(b"0500030103", conn.writes[5][1])
+
+        hub.BATTERY_MAX_AGE = 0
+        conn.notification_delayed('060001060630', 0.1)
+        self.assertEqual(48, hub.voltage_level)
+        self.assertEqual(b"0500010605", conn.writes[6][1])
+        conn.wait_notifications_handled()
+
+
+class SmartHubTest(unittest.TestCase):
+    def test_wait_for_devices(self):
+        conn = ConnectionMock()
+        conn.notifications.append('0f00 04 32 0117000100000001000000')
+        conn.notifications.append('0f00 04 3b 0115000200000002000000')
+        conn.notification_delayed('0f00 04 3c 0114000200000002000000', 0.1)
+        start = time.time()
+        hub = SmartHub(conn.connect())
+        self.assertLess(time.time() - start, 0.5)  # returns on last attach, not on polling tick
+        self.assertIsNotNone(hub.voltage)
+        conn.wait_notifications_handled()
+
+    def test_missing_devices(self):
+        class ShortWaitHub(SmartHub):
+            DEVICES_TIMEOUT = 0.1
+
+        conn = ConnectionMock()
+        conn.notifications.append('0f00 04 32 0117000100000001000000')
+        hub = ShortWaitHub(conn.connect())
+        self.assertIsNotNone(hub.led)
+        self.assertIsNone(hub.voltage)
+        self.assertFalse(hub._wait_for_devices(timeout=0))
+        self.assertTrue(hub._wait_for_devices(lambda: [hub.led]))
+        conn.wait_notifications_handled()
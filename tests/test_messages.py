@@ -0,0 +1,85 @@
+import unittest
+from binascii import unhexlify
+from threading import Thread
+
+from pylgbst.messages import MsgPortInfo, MsgPortInputFmtSingle, MsgHubProperties, MsgPortModeInfo, MsgHubAttachedIO, \
+    MsgPortOutputFeedback, MsgHubAlert, MsgPortValueSingle
+
+
+def decode(cls, data):
+    return cls.decode(unhexlify(data.replace(' ', '')))
+
+
+class MessagesTest(unittest.TestCase):
+    def test_decode_fields(self):
+        msg = decode(MsgHubAttachedIO, '0f00 04 01 01 26000000001000000010')
+        self.assertEqual(1, msg.port)
+        self.assertEqual(MsgHubAttachedIO.EVENT_ATTACHED, msg.event)
+        self.assertEqual(unhexlify('26000000001000000010'), msg.payload)
+
+        msg = decode(MsgHubProperties, '1200 01 01 06 4c45474f204d6f766520487562')
+        self.assertEqual(b"LEGO Move Hub", msg.parameters)
+        self.assertIn("'parameters': b'4c45474f204d6f766520487562'", repr(msg))
+
+        msg = decode(MsgPortInputFmtSingle, '0900 47 02 08 01000000')
+        self.assertEqual(1, msg.upd_delta)
+        self.assertIsNone(msg.upd_enabled)
+
+        msg = decode(MsgPortModeInfo, '1100 44 02 00 00 434f4c4f5200000000000000')
+        self.assertEqual("COLOR", msg.value)
+
+        msg = decode(MsgPortModeInfo, '0e00 44 02 00 01 00000000 0000c842')
+        self.assertEqual([0.0, 100.0], msg.value)
+
+    def test_payload_read(self):
+        msg = decode(MsgHubAttachedIO, '0f00 04 01 01 26000000001000000010')
+        data = (msg._data, msg._offset)
+        repr(msg)
+        self.assertEqual(msg.payload, msg.payload)
+        self.assertEqual(data, (msg._data, msg._offset))  # reads don't change message shared between threads
+
+        payloads = []
+        threads = [Thread(target=lambda: payloads.append(msg.payload)) for _ in range(8)]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        self.assertEqual([unhexlify('26000000001000000010')] * 8, payloads)
+
+    def test_decoded_immutable(self):
+        def state(msg):
+            return [getattr(msg, name) for cls in type(msg).__mro__ for name in cls.__dict__.get("__slots__", ())]
+
+        for cls, data in ((MsgHubProperties, '0600 01 05 06 c4'), (MsgHubAlert, '0600 03 01 04 ff'),
+                          (MsgPortValueSingle, '0600 45 02 ff00'), (MsgPortOutputFeedback, '0700 82 01 0a 02 01')):
+            msg = decode(cls, data)
+            before = state(msg)
+            repr(msg)
+            msg.payload
+            self.assertEqual(before, state(msg), cls)
+
+    def test_hub_property_values(self):
+        self.assertEqual("LEGO Move Hub", decode(MsgHubProperties, '1200 01 01 06 4c45474f204d6f766520487562').value())
+        self.assertEqual("1.0.00.0157", decode(MsgHubProperties, '0900 01 03 06 57010010').value())
+        self.assertEqual(-60, decode(MsgHubProperties, '0600 01 05 06 c4').value())
+        self.assertEqual("00:16:53:a0:d1:d4", decode(MsgHubProperties, '0b00 01 0d 06 001653a0d1d4').value())
+        self.assertEqual("3.00", decode(MsgHubProperties, '0700 01 0a 06 0003').value())
+
+    def test_output_feedback(self):
+        msg = decode(MsgPortOutputFeedback, '0900 82 01 0a 02 01 03 0a')
+        self.assertEqual([(1, 10), (2, 1), (3, 10)], msg.feedbacks)
+        self.assertEqual((1, 10), (msg.port, msg.status))
+
+        parts = msg.split()
+        self.assertEqual([2], [x.port for x in parts if x.is_in_progress()])
+        self.assertEqual([[(3, 10)]], [x.feedbacks for x in parts if x.port == 3])
+
+    def test_port_info(self):
+        msg = decode(MsgPortInfo, '0b00 43 02 01 07 0b 5f06 a000')
+        self.assertEqual(11, msg.total_modes)
+        self.assertEqual([0, 1, 2, 3, 4, 6, 9, 10], msg.input_modes)
+        self.assertEqual([5, 7], msg.output_modes)
+        self.assertTrue(msg.is_combinable())
+
+        msg = decode(MsgPortInfo, '0b00 43 02 02 4f00 0300 0000')
+        self.assertEqual([[0, 1, 2, 3, 6], [0, 1], []], msg.possible_mode_combinations)
@@ -1,11 +1,61 @@
+import asyncio
 import logging
 import time
 import unittest
+from concurrent import futures
+from threading import Thread
 
 from pylgbst.hub import MoveHub
+from pylgbst.messages import MsgHubProperties, MsgPortInfoRequest, MsgPortInputFmtSetupCombined, MsgPortModeInfoRequest
 from pylgbst.peripherals import LEDRGB, TiltSensor, COLOR_RED, Button, Current, Voltage, VisionSensor, \
-    EncodedMotor
-from tests import HubMock
+    EncodedMotor, RemoteButton
+from tests import HubMock, ConnectionMock
+
+
+class ModeAckConnection(ConnectionMock):
+    """
+    Acknowledges port mode setups, sending value of new mode if its updates are enabled
+    """
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = values
+        self.attached = True
+
+    def write(self, handle, data):
+        super().write(handle, data)
+        if not self.attached:
+            return
+        if len(data) > 3 and data[2] == 0x41:
+            self.notifications.append('0a0047' + data[3:].hex())
+            if data[9]:
+                self.notifications.append(self.values[data[4]])
+        elif len(data) > 4 and data[2] == 0x21 and data[4] == MsgPortInfoRequest.INFO_MODE_INFO:
+            self.notifications.append('0b0043%02x0102063f000000' % data[3])  # input only, not combinable
+        elif len(data) > 4 and data[2] == 0x22:
+            self.notifications.append('0500052206')  # no mode details
+
+
+class CombinedModeConnection(ConnectionMock):
+    """
+    Motor port that allows combining speed and angle modes
+    """
+
+    def write(self, handle, data):
+        super().write(handle, data)
+        if len(data) < 5:
+            return
+        port = data[3]
+        if data[2] == 0x21 and data[4] == MsgPortInfoRequest.INFO_MODE_INFO:
+            self.notifications.append('0b0043%02x01070406000100' % port)
+        elif data[2] == 0x21 and data[4] == MsgPortInfoRequest.INFO_MODE_COMBINATIONS:
+            self.notifications.append('090043%02x0206000000' % port)
+        elif data[2] == 0x22 and data[5] == MsgPortModeInfoRequest.INFO_VALUE_FORMAT:
+            mode = data[4]
+            self.notifications.append('0a0044%02x%02x8001%02x0400' % (port, mode, 0 if mode == 1 else 2))
+        elif data[2] == 0x42 and data[4] == MsgPortInputFmtSetupCombined.SUBCMD_UNLOCK_MULTI_UPDATE:
+            self.notifications.append('070048%02x800300' % port)
+            self.notifications.append('0b0046%02x0300055a000000' % port)  # speed 5, angle 90
 
 
 class PeripheralsTest(unittest.TestCase):
@@ -105,6 +155,32 @@ class PeripheralsTest(unittest.TestCase):
         self.assertEqual(b"0a00413c000100000001", hub.writes[1][1])
         self.assertEqual(b"0a00413c000100000000", hub.writes[2][1])
 
+    def test_remote_button(self):
+        hub = HubMock()
+        button = RemoteButton(hub, 0x00)
+        hub.peripherals[0x00] = button
+
+        vals = []
+
+        def callback(*args):
+            vals.append(args)
+
+        hub.connection.notification_delayed('0a004700000100000001', 0.05)
+        hub.connection.notification_delayed('060001020600', 0.1)
+        button.subscribe(callback, RemoteButton.KEYA)
+        self.assertEqual(b"0500010202", hub.writes[-1][1])  # green button updates enabled with hub properties
+
+        hub.connection.notification_delayed('0500450001', 0.05)
+        hub.connection.notification_delayed('060001020601', 0.1)
+        time.sleep(0.2)
+        self.assertEqual([("PLUS", "LEFT"), (1,)], vals)
+
+        hub.connection.notification_delayed('0a004700000100000000', 0.05)
+        button.unsubscribe(callback)
+        self.assertEqual(b"0500010203", hub.writes[-1][1])
+        self.assertNotIn(MsgHubProperties.BUTTON, hub.properties._subscribers)
+        hub.connection.wait_notifications_handled()
+
     def test_tilt_sensor(self):
         hub = HubMock()
         sensor = TiltSensor(hub, MoveHub.PORT_TILT_SENSOR)
@@ -195,6 +271,139 @@ class PeripheralsTest(unittest.TestCase):
 
         hub.connection.wait_notifications_handled()
 
+    def test_motors_feedback(self):
+        hub = HubMock()
+        motor_c = EncodedMotor(hub, MoveHub.PORT_C)
+        motor_d = EncodedMotor(hub, MoveHub.PORT_D)
+        hub.peripherals[MoveHub.PORT_C] = motor_c
+        hub.peripherals[MoveHub.PORT_D] = motor_d
+
+        hub.connection.notification_delayed('070082020103 01', 0.1)
+        hub.connection.notification_delayed('070082020a030a', 0.2)  # both motors reported in one message
+        thr = Thread(target=motor_c.angled, args=(90,))
+        thr.start()
+        motor_d.angled(90)
+        thr.join(1)
+
+        self.assertFalse(thr.is_alive())
+        motor_c.wait_complete(1)
+        motor_d.wait_complete(1)
+        self.assertEqual([], hub._sync_requests)
+        hub.connection.wait_notifications_handled()
+
+    def test_motor_futures(self):
+        hub = HubMock()
+        motor_c = EncodedMotor(hub, MoveHub.PORT_C)
+        motor_d = EncodedMotor(hub, MoveHub.PORT_D)
+        hub.peripherals[MoveHub.PORT_C] = motor_c
+        hub.peripherals[MoveHub.PORT_D] = motor_d
+
+        done_c = motor_c.angled(90, wait_complete=False)
+        done_d = motor_d.timed(0.5, wait_complete=False)
+        self.assertTrue(motor_c.cmd_in_progress)
+        self.assertRaises(TimeoutError, motor_d.wait_complete, 0.05)
+
+        hub.connection.notification_delayed('070082020a030a', 0.1)
+        done, not_done = futures.wait([done_c, done_d], 1)
+        self.assertEqual(set(), not_done)
+        motor_d.wait_complete(1)
+
+        # command replaced by next one is not complete, but is over
+        first = motor_c.goto_position(0, wait_complete=False)
+        hub.connection.notification_delayed('0500820204', 0.1)
+        self.assertTrue(first.result(1).is_discarded())
+
+        hub.connection.notification_delayed('050082020a', 0.1)
+        motor_c.goto_position(0)
+        hub.connection.wait_notifications_handled()
+
+    def test_motor_error(self):
+        hub = HubMock()
+        motor_c = EncodedMotor(hub, MoveHub.PORT_C)
+        motor_d = EncodedMotor(hub, MoveHub.PORT_D)
+        hub.peripherals[MoveHub.PORT_C] = motor_c
+        hub.peripherals[MoveHub.PORT_D] = motor_d
+
+        hub.connection.notification_delayed('0500820201', 0.1)  # first motor accepts its command
+        thr = Thread(target=motor_c.angled, args=(90,))
+        thr.start()
+        time.sleep(0.2)
+
+        hub.connection.notification_delayed('0500058106', 0.1)  # second motor's command is rejected
+        self.assertRaises(RuntimeError, motor_d.angled, 90)
+        self.assertTrue(thr.is_alive())
+
+        hub.connection.notification_delayed('050082020a', 0.1)
+        thr.join(1)
+        self.assertFalse(thr.is_alive())
+        self.assertEqual([], hub._sync_requests)
+        hub.connection.wait_notifications_handled()
+
+    def test_motor_long_command(self):
+        hub = HubMock()
+        hub.timeout = 0.3
+        motor = EncodedMotor(hub, MoveHub.PORT_D)
+        hub.peripherals[MoveHub.PORT_D] = motor
+
+        hub.connection.notification_delayed('0500820301', 0.05)
+        hub.connection.notification_delayed('050082030a', 0.6)  # moves longer than hub's timeout
+        motor.timed(0.5)
+        self.assertFalse(motor.cmd_in_progress)
+
+        async def scenario():
+            hub.connection.notification_delayed('0500820301', 0.05)
+            hub.connection.notification_delayed('050082030a', 0.6)
+            await motor.timed_async(0.5)
+
+        asyncio.run(scenario())
+        self.assertFalse(motor.cmd_in_progress)
+
+        self.assertRaises(TimeoutError, motor.timed, 0.5)  # not accepted in time
+        self.assertEqual([], hub._sync_requests)
+
+        hub.COMPLETION_TIMEOUT = 0.3
+        hub.connection.notification_delayed('0500820301', 0.05)  # accepted, but completion never comes
+        self.assertRaises(TimeoutError, motor.timed, 0.5)
+
+        async def lost_completion():
+            hub.connection.notification_delayed('0500820301', 0.05)
+            await motor.timed_async(0.5)
+
+        self.assertRaises(TimeoutError, asyncio.run, lost_completion())
+        self.assertEqual([], hub._sync_requests)
+        hub.connection.wait_notifications_handled()
+
+    def test_motor_async(self):
+        hub = HubMock()
+        motor = EncodedMotor(hub, MoveHub.PORT_D)
+        hub.peripherals[MoveHub.PORT_D] = motor
+
+        vals = []
+
+        async def callback(*args):
+            vals.append(args)
+
+        async def scenario():
+            hub.connection.notification_delayed('0500820301', 0.1)
+            hub.connection.notification_delayed('050082030a', 0.2)
+            await motor.angled_async(180)
+
+            hub.connection.notification_delayed('0a004703020100000001', 0.1)
+            await motor.subscribe_async(callback)
+            hub.connection.notification_delayed("08004503ffffffff", 0.1)
+            await asyncio.sleep(0.3)
+
+            hub.connection.notification_delayed('0a004703020000000000', 0.1)
+            await motor.unsubscribe_async(callback)
+
+        asyncio.run(scenario())
+        hub.connection.wait_notifications_handled()
+
+        self.assertEqual(b"0e008103110bb400000064647f03", hub.writes[1][1])
+        self.assertEqual(b"0a004103020100000001", hub.writes[2][1])
+        self.assertEqual(b"0a004103020100000000", hub.writes[3][1])
+        self.assertEqual([(-1,)], vals)
+
     def test_motor_sensor(self):
         hub = HubMock()
         motor = EncodedMotor(hub, MoveHub.PORT_C)
@@ -205,19 +414,128 @@ class PeripheralsTest(unittest.TestCase):
         def callback(*args):
             vals.append(args)
 
+        timed = []
+
+        def timed_callback(timestamp, *args):
+            timed.append((timestamp, args))
+
         hub.connection.notification_delayed('0a004702020100000001', 0.1)
         motor.subscribe(callback)
+        motor.subscribe(timed_callback, timestamps=True)
 
+        started = time.monotonic_ns()
         hub.connection.notification_delayed("0800450200000000", 0.1)
         hub.connection.notification_delayed("08004502ffffffff", 0.2)
         hub.connection.notification_delayed("08004502feffffff", 0.3)
         time.sleep(0.4)
 
+        motor.unsubscribe(timed_callback)
         hub.connection.notification_delayed('0a004702020000000000', 0.1)
         motor.unsubscribe(callback)
         hub.connection.wait_notifications_handled()
 
         self.assertEqual([(0,), (-1,), (-2,)], vals)
+        self.assertEqual([(0,), (-1,), (-2,)], [x[1] for x in timed])
+        stamps = [x[0] for x in timed]
+        self.assertEqual(sorted(stamps), stamps)
+        self.assertLess(started, stamps[0])
+
+    def test_sensor_value_cache(self):
+        hub = HubMock()
+        cds = VisionSensor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = cds
+        cds.max_value_age = 10
+
+        hub.connection.notification_delayed('0a004702080000000000', 0.1)
+        hub.connection.notification_delayed('08004502ff0aff00', 0.2)
+        self.assertEqual((255, 10.0), cds.get_sensor_data(VisionSensor.COLOR_DISTANCE_FLOAT))
+        writes = len(hub.writes)
+        self.assertEqual((255, 10.0), cds.get_sensor_data(VisionSensor.COLOR_DISTANCE_FLOAT))
+        self.assertEqual(writes, len(hub.writes))
+
+        hub.connection.notification_delayed('0800450203050000', 0.1)
+        self.assertEqual((3, 5.0), cds.get_sensor_data(VisionSensor.COLOR_DISTANCE_FLOAT, max_age=0))
+        self.assertEqual(writes + 1, len(hub.writes))
+
+        # subscription keeps value fresh
+        hub.connection.notification_delayed('0a004702080100000001', 0.1)
+        cds.subscribe(None)
+        hub.connection.notification_delayed('08004502ff0aff00', 0.1)
+        time.sleep(0.2)
+        writes = len(hub.writes)
+        self.assertEqual((255, 10.0), cds.get_sensor_data(VisionSensor.COLOR_DISTANCE_FLOAT, max_age=0))
+        self.assertEqual(writes, len(hub.writes))
+        hub.connection.wait_notifications_handled()
+
+    def test_mode_polling(self):
+        hub = HubMock(ModeAckConnection({
+            VisionSensor.COLOR_INDEX: '0500450203',
+            VisionSensor.DISTANCE_INCHES: '0500450205',
+        }))
+        cds = VisionSensor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = cds
+
+        cds.start_polling([VisionSensor.COLOR_INDEX, VisionSensor.DISTANCE_INCHES], interval=0.05)
+        self.assertRaises(ValueError, cds.subscribe, None)
+        for _ in range(3):
+            self.assertEqual(3, cds.color)
+            self.assertEqual(5, cds.distance)
+        self.assertNotIn(b"0500210200", [x[1] for x in hub.writes])  # no value requests
+
+        cds.stop_polling()
+        self.assertEqual(b"0a0041020", hub.writes[-1][1][:9])
+        self.assertEqual(b"00", hub.writes[-1][1][-2:])  # updates switched off
+        hub.connection.wait_notifications_handled()
+
+    def test_detach_while_polling(self):
+        hub = HubMock(ModeAckConnection({
+            VisionSensor.COLOR_INDEX: '0500450203',
+            VisionSensor.DISTANCE_INCHES: '0500450205',
+        }))
+        hub.timeout = 0.2
+        cds = VisionSensor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = cds
+
+        cds.start_polling([VisionSensor.COLOR_INDEX, VisionSensor.DISTANCE_INCHES], interval=0.05)
+        self.assertEqual(3, cds.color)
+        poller = cds._poller
+
+        hub.connection.attached = False  # mode switches are not replied anymore
+        hub.connection.notifications.append('0500040200')
+        time.sleep(0.1)
+        self.assertNotIn(MoveHub.PORT_C, hub.peripherals)
+        self.assertIsNone(cds._poller)
+
+        poller._thread.join(1)  # pending mode switch times out
+        self.assertFalse(poller._thread.is_alive())
+        writes = len(hub.writes)
+        time.sleep(0.1)
+        self.assertEqual(writes, len(hub.writes))  # no switch off for detached device
+        hub.connection.wait_notifications_handled()
+
+    def test_combined_mode(self):
+        hub = HubMock(CombinedModeConnection())
+        motor = EncodedMotor(hub, MoveHub.PORT_C)
+        hub.peripherals[MoveHub.PORT_C] = motor
+
+        vals = []
+        motor.subscribe_combined(vals.append, [EncodedMotor.SENSOR_SPEED, EncodedMotor.SENSOR_ANGLE])
+        self.assertEqual(b"0500420202", hub.writes[3][1])  # lock, after value format queries
+        self.assertEqual(b"0800420201001020", hub.writes[-2][1])  # combination of speed and angle
+        self.assertRaises(ValueError, motor.subscribe, None)
+
+        hub.connection.notification_delayed('0a0046020200b4000000', 0.1)  # only angle updated
+        time.sleep(0.2)
+        self.assertEqual([{1: (5,), 2: (90,)}, {2: (180,)}], vals)
+
+        writes = len(hub.writes)
+        self.assertEqual((5,), motor.get_sensor_data(EncodedMotor.SENSOR_SPEED))
+        self.assertEqual((180,), motor.get_sensor_data(EncodedMotor.SENSOR_ANGLE))
+        self.assertEqual(writes, len(hub.writes))  # served from combined mode values
+
+        hub.connection.notification_delayed('0a004702020100000000', 0.1)
+        motor.unsubscribe(vals.append)
+        hub.connection.wait_notifications_handled()
 
     def test_color_sensor(self):
         hub = HubMock()
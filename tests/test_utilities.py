@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from pylgbst.utilities import Dispatcher, PortDataBuffer, queue
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_job_runs_once_at_a_time(self):
+        dispatcher = Dispatcher(workers=3, idle_timeout=0.1)
+        running = []
+        calls = []
+        release = threading.Event()
+
+        def job():
+            running.append(1)
+            self.assertEqual(1, len(running))
+            calls.append(1)
+            release.wait(1)
+            running.pop()
+
+        dispatcher.schedule(job)
+        time.sleep(0.05)
+        for _ in range(10):
+            dispatcher.schedule(job)  # all of these collapse into single rerun
+        release.set()
+        time.sleep(0.1)
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual({}, dispatcher._jobs)
+
+    def test_bounded_workers(self):
+        dispatcher = Dispatcher(workers=2, idle_timeout=0.1)
+        done = []
+        jobs = [lambda n=n: done.append(n) or time.sleep(0.05) for n in range(5)]
+        for job in jobs:
+            dispatcher.schedule(job)
+        self.assertEqual(2, len(dispatcher._threads))
+
+        time.sleep(0.5)
+        self.assertEqual([0, 1, 2, 3, 4], sorted(done))
+        self.assertEqual([], dispatcher._threads)  # idle workers are gone
+
+
+class PortDataBufferTest(unittest.TestCase):
+    def _drain(self, buf):
+        items = []
+        while True:
+            try:
+                items.append(buf.get_nowait())
+            except queue.Empty:
+                return items
+
+    def test_policies(self):
+        buf = PortDataBuffer(PortDataBuffer.LATEST, 2)
+        for x in range(5):
+            buf.put(x)
+        self.assertEqual((3, 2, 2), (buf.drops, buf.depth, buf.max_depth))
+        self.assertEqual([3, 4], self._drain(buf))
+
+        buf = PortDataBuffer(PortDataBuffer.FIFO, 2)
+        for x in range(5):
+            buf.put(x)
+        self.assertEqual(3, buf.drops)
+        self.assertEqual([0, 1], self._drain(buf))
+
+        buf = PortDataBuffer(PortDataBuffer.UNBOUNDED)
+        for x in range(5):
+            self.assertTrue(buf.put(x))
+        self.assertEqual((0, 5), (buf.drops, buf.max_depth))
+        self.assertEqual([0, 1, 2, 3, 4], self._drain(buf))
+
+    def test_block(self):
+        buf = PortDataBuffer(PortDataBuffer.BLOCK, 1, timeout=0.05)
+        buf.put(0)
+        self.assertFalse(buf.put(1))  # times out
+        self.assertEqual(1, buf.drops)
+
+        buf.timeout = 1
+        consumer = threading.Timer(0.05, buf.get_nowait)
+        consumer.start()
+        self.assertTrue(buf.put(2))  # waits for consumer
+        self.assertEqual([2], self._drain(buf))